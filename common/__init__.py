@@ -0,0 +1,9 @@
+# Общие модули ботов. Боты и нагрузочные замеры запускаются из корня
+# репозитория как модули, тогда и common, и модули самой лабораторной
+# импортируются по полному имени:
+#   python -m lab4.lab4
+#   python -m lab5.bot5
+#   python -m lab6.bot
+#   python -m rgz.bot
+#   python -m lab6.benchmark http
+#   python -m rgz.benchmark
@@ -0,0 +1,207 @@
+import asyncio
+import bisect
+import re
+from collections import namedtuple
+
+# Не больше стольких подписок у одного чата
+MAX_ALERTS_PER_CHAT = 20
+
+ALERT_USAGE = "/alert USD > 95"
+
+# Подписка: сообщить в chat_id, когда курс currency_name станет больше (op '>')
+# или меньше (op '<') порога threshold
+Alert = namedtuple('Alert', ['id', 'chat_id', 'currency_name', 'op', 'threshold'])
+
+_ALERT = re.compile(r'\s*([^\W\d_]+)\s*([<>])\s*(\d+(?:[.,]\d+)?)\s*')
+_AFTER_ALL = float('inf')
+
+
+# Разбирает "USD > 95" в ('USD', '>', 95.0); None, если формат другой
+def parse_alert(text):
+    match = _ALERT.fullmatch(text or '')
+    if match is None:
+        return None
+    currency_name, op, threshold = match.groups()
+    return currency_name, op, float(threshold.replace(',', '.'))
+
+
+def describe_alert(alert):
+    return f"{alert.currency_name} {alert.op} {alert.threshold:g}"
+
+
+# Индекс подписок. Для каждой валюты пороги '>' и '<' хранятся в двух
+# отсортированных списках пар (порог, id), поэтому при изменении курса с old
+# на new сработавшие подписки находятся двоичным поиском по отрезку между
+# old и new, а не перебором всех подписок. Подписка срабатывает, когда курс
+# пересекает порог: '>' - при old <= порог < new, '<' - при new < порог <= old;
+# у новой валюты (old = None) - если условие выполняется для new
+class AlertIndex:
+    def __init__(self):
+        self._alerts = {}
+        self._by_chat = {}
+        self._above = {}
+        self._below = {}
+
+    def load(self, alerts):
+        self.__init__()
+        for alert in alerts:
+            self.add(alert)
+
+    def _thresholds(self, alert):
+        index = self._above if alert.op == '>' else self._below
+        return index.setdefault(alert.currency_name, [])
+
+    def add(self, alert):
+        self._alerts[alert.id] = alert
+        self._by_chat.setdefault(alert.chat_id, set()).add(alert.id)
+        bisect.insort(self._thresholds(alert), (alert.threshold, alert.id))
+
+    def remove(self, alert_id):
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        chat_alerts = self._by_chat[alert.chat_id]
+        chat_alerts.discard(alert_id)
+        if not chat_alerts:
+            del self._by_chat[alert.chat_id]
+        thresholds = self._thresholds(alert)
+        del thresholds[bisect.bisect_left(thresholds, (alert.threshold, alert_id))]
+        return alert
+
+    def get(self, alert_id):
+        return self._alerts.get(alert_id)
+
+    def for_chat(self, chat_id):
+        return sorted(self._alerts[alert_id] for alert_id in self._by_chat.get(chat_id, ()))
+
+    def __len__(self):
+        return len(self._alerts)
+
+    def triggered(self, currency_name, old, new):
+        new = float(new)
+        old = float(old) if old is not None else None
+        found = []
+
+        if old is None or new > old:
+            thresholds = self._above.get(currency_name, [])
+            low = 0 if old is None else bisect.bisect_left(thresholds, (old,))
+            high = bisect.bisect_left(thresholds, (new,))
+            found.extend(thresholds[low:high])
+
+        if old is None or new < old:
+            thresholds = self._below.get(currency_name, [])
+            low = bisect.bisect_right(thresholds, (new, _AFTER_ALL))
+            high = len(thresholds) if old is None else bisect.bisect_right(thresholds, (old, _AFTER_ALL))
+            found.extend(thresholds[low:high])
+
+        return [self._alerts[alert_id] for _, alert_id in found]
+
+
+# Выполняется ли условие подписки при курсе rate
+def condition_met(op, threshold, rate):
+    rate = float(rate)
+    return rate > threshold if op == '>' else rate < threshold
+
+
+# Подписки бота: индекс в памяти, копия в хранилище store и отправка
+# уведомлений. Хранилище - объект с асинхронными методами:
+#   all()                                 - все подписки (список Alert)
+#   add(chat_id, currency_name, op, threshold) - новая подписка (Alert)
+#   delete(alert_ids, chat_id=None)       - удаляет подписки (только этого
+#                                           чата, если он указан) и
+#                                           возвращает id удалённых
+# Сработавшая подписка удаляется из хранилища; уведомление отправляется,
+# только если удалил её этот процесс, поэтому при нескольких процессах бота
+# оно не приходит дважды. Подписки, добавленные и удалённые другими
+# процессами, передаются в remember и forget. send(chat_id, text) - отправка
+# сообщения
+class Alerts:
+    def __init__(self, store, send):
+        self.store = store
+        self.send = send
+        self.index = AlertIndex()
+        self._tasks = set()
+
+    async def load(self):
+        self.index.load(await self.store.all())
+
+    # Повторное сообщение о той же подписке ничего не меняет: процесс
+    # получает и уведомления о собственных изменениях
+    def remember(self, alert):
+        if self.index.get(alert.id) is None:
+            self.index.add(alert)
+
+    def forget(self, alert_id):
+        self.index.remove(alert_id)
+
+    # Вызывается при изменении курса currency_name с old на new
+    def on_rate_change(self, currency_name, old, new):
+        fired = self.index.triggered(currency_name, old, new)
+        if not fired:
+            return
+        for alert in fired:
+            self.index.remove(alert.id)
+        task = asyncio.create_task(self._notify(fired, new))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Дожидается уведомлений о сработавших подписках
+    async def close(self):
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _notify(self, fired, rate):
+        deleted = set(await self.store.delete([alert.id for alert in fired]))
+        await asyncio.gather(*(
+            self.send(alert.chat_id, f"Курс {alert.currency_name}: {rate} RUB ({describe_alert(alert)})")
+            for alert in fired if alert.id in deleted
+        ), return_exceptions=True)
+
+    # Ответ на /alert: без аргументов - список подписок чата, с аргументами -
+    # новая подписка. lookup(название) возвращает (название из каталога,
+    # текущий курс) или None, если валюты нет
+    async def command(self, chat_id, args, lookup):
+        if not args:
+            chat_alerts = self.index.for_chat(chat_id)
+            if not chat_alerts:
+                return f"Подписок нет. Пример: {ALERT_USAGE}"
+            lines = ["Ваши подписки (удалить: /unalert номер):"]
+            lines.extend(f"{alert.id}: {describe_alert(alert)}" for alert in chat_alerts)
+            return "\n".join(lines)
+
+        parsed = parse_alert(args)
+        if parsed is None:
+            return f"Не удалось разобрать подписку. Пример: {ALERT_USAGE}"
+        if len(self.index.for_chat(chat_id)) >= MAX_ALERTS_PER_CHAT:
+            return f"Не больше {MAX_ALERTS_PER_CHAT} подписок"
+
+        currency_name, op, threshold = parsed
+        found = await lookup(currency_name)
+        if found is None:
+            return "Данная валюта не найдена"
+        currency_name, rate = found
+
+        # Подписка срабатывает при пересечении порога; если условие уже
+        # выполнено, такого пересечения не будет
+        if condition_met(op, threshold, rate):
+            return (
+                f"Курс {currency_name} уже {op} {threshold:g} (сейчас {rate} RUB), "
+                f"подписка не создана"
+            )
+
+        self.remember(await self.store.add(chat_id, currency_name, op, threshold))
+        return (
+            f"Сообщу, когда курс {currency_name} станет {op} {threshold:g} "
+            f"(сейчас {rate} RUB)"
+        )
+
+    # Ответ на /unalert номер
+    async def unalert_command(self, chat_id, args):
+        try:
+            alert_id = int(args or '')
+        except ValueError:
+            return "Укажите номер подписки из списка /alert"
+
+        if not await self.store.delete([alert_id], chat_id=chat_id):
+            return "Подписка не найдена"
+        self.index.remove(alert_id)
+        return "Подписка удалена"
@@ -0,0 +1,54 @@
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# Строка отчёта: среднее, p50 и p99 в миллисекундах, а если известно
+# общее время - ещё и запросы в секунду
+def report(title, timings, elapsed=None):
+    ms = [t * 1000 for t in timings]
+    line = (
+        f"{title:<28} n={len(ms):<6} "
+        f"avg={statistics.mean(ms):8.3f} ms  "
+        f"p50={percentile(ms, 50):8.3f} ms  "
+        f"p99={percentile(ms, 99):8.3f} ms"
+    )
+    if elapsed:
+        line += f"  rps={len(ms) / elapsed:9.1f}"
+    print(line)
+
+
+# Нагрузка по HTTP: concurrency клиентов без пауз шлют GET на url, пока
+# не наберётся requests_count ответов. Возвращает (времена ответов, общее
+# время, число ответов со статусом 400 и выше)
+async def bench_http(url, requests_count, concurrency, headers=None):
+    timings = []
+    errors = 0
+    remaining = requests_count
+
+    async def worker(session):
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            async with session.get(url, headers=headers) as response:
+                await response.read()
+                if response.status >= 400:
+                    errors += 1
+            timings.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return timings, elapsed, errors
@@ -0,0 +1,55 @@
+import hashlib
+import re
+
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
+
+# Не больше стольких пар в одной команде /convert или inline-запросе
+MAX_CONVERSIONS = 20
+
+# Сколько секунд Telegram может отдавать ответ на inline-запрос из своего кэша
+INLINE_CACHE_TIME = 10
+
+CONVERT_USAGE = "/convert 100 USD, 50 EUR"
+
+# Сумма (дробная часть через точку или запятую) и название валюты; пары
+# разделяются запятой, точкой с запятой или просто пробелом перед суммой
+_ITEM = re.compile(r'\s*(\d+(?:[.,]\d+)?)\s*([^\W\d_]+)\s*(?:[,;]|(?=\d)|$)')
+
+
+# Разбирает "100 USD, 50 EUR" в [(100.0, 'USD'), (50.0, 'EUR')].
+# Возвращает None, если текст не подходит под этот формат
+def parse_conversions(text, max_items=MAX_CONVERSIONS):
+    text = (text or '').strip()
+    pairs = []
+    pos = 0
+    while pos < len(text):
+        match = _ITEM.match(text, pos)
+        if match is None or len(pairs) == max_items:
+            return None
+        amount, currency_name = match.groups()
+        pairs.append((float(amount.replace(',', '.')), currency_name))
+        pos = match.end()
+    return pairs or None
+
+
+# Одна строка ответа на каждую пару; get_rate(название) возвращает курс
+# к рублю или None, если валюты нет
+def format_conversions(pairs, get_rate):
+    lines = []
+    for amount, currency_name in pairs:
+        rate = get_rate(currency_name)
+        if rate is None:
+            lines.append(f"{currency_name}: валюта не найдена")
+        else:
+            lines.append(f"{amount} {currency_name} = {amount * float(rate):.2f} RUB")
+    return "\n".join(lines)
+
+
+# Результат inline-режима: по нажатию в чат отправляется text
+def inline_article(title, text):
+    return InlineQueryResultArticle(
+        id=hashlib.md5(text.encode()).hexdigest(),
+        title=title,
+        description=text,
+        input_message_content=InputTextMessageContent(message_text=text)
+    )
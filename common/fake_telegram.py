@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import itertools
+import time
+
+from aiohttp import ClientSession, web
+
+# Локальная замена Bot API для проверки ботов без доступа к Telegram.
+# Бот подключается к ней через TELEGRAM_API_URL=http://127.0.0.1:8081.
+#
+# Отвечает на методы Bot API (отправленные сообщения запоминаются),
+# доставляет обновления на зарегистрированный вебхук или через getUpdates
+# и имеет служебные адреса:
+#   POST /_send      {"chat_id": 1, "text": "/start"} - сообщение от пользователя
+#   POST /_update    готовый объект Update
+#   GET  /_messages  всё, что бот отправил
+#
+# Запуск: python -m common.fake_telegram --port 8081
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.sent = []
+        self._updates = asyncio.Queue()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._session = None
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post('/_send', self.handle_send)
+        app.router.add_post('/_update', self.handle_update)
+        app.router.add_get('/_messages', self.handle_messages)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle_method)
+        app.on_cleanup.append(self._close)
+        return app
+
+    async def _close(self, app):
+        if self._session is not None:
+            await self._session.close()
+
+    def _message(self, chat_id, text, from_bot):
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'from': {'id': 1 if from_bot else int(chat_id), 'is_bot': from_bot, 'first_name': 'Fake'},
+            'text': text,
+        }
+
+    async def deliver(self, update):
+        update.setdefault('update_id', next(self._update_ids))
+        if self.webhook_url is None:
+            await self._updates.put(update)
+            return None
+
+        if self._session is None:
+            self._session = ClientSession()
+        headers = {}
+        if self.webhook_secret:
+            headers['X-Telegram-Bot-Api-Secret-Token'] = self.webhook_secret
+        async with self._session.post(self.webhook_url, json=update, headers=headers) as response:
+            return response.status
+
+    async def handle_send(self, request):
+        data = await request.json()
+        text = data['text']
+        message = self._message(data['chat_id'], text, from_bot=False)
+        if text.startswith('/'):
+            command = text.split()[0]
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        status = await self.deliver({'message': message})
+        return web.json_response({'ok': True, 'webhook_status': status})
+
+    async def handle_update(self, request):
+        status = await self.deliver(await request.json())
+        return web.json_response({'ok': True, 'webhook_status': status})
+
+    async def handle_messages(self, request):
+        return web.json_response(self.sent)
+
+    async def handle_method(self, request):
+        method = request.match_info['method'].lower()
+        params = {}
+        if request.can_read_body:
+            if request.content_type == 'application/json':
+                params = await request.json()
+            else:
+                params = dict(await request.post())
+
+        if method == 'getme':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        elif method == 'setwebhook':
+            self.webhook_url = params.get('url')
+            self.webhook_secret = params.get('secret_token')
+            result = True
+        elif method == 'deletewebhook':
+            self.webhook_url = None
+            result = True
+        elif method == 'getupdates':
+            result = await self._get_updates(float(params.get('timeout', 0)))
+        elif method in ('sendmessage', 'editmessagetext'):
+            self.sent.append({'method': method, **params})
+            result = self._message(params['chat_id'], params.get('text', ''), from_bot=True)
+        else:
+            self.sent.append({'method': method, **params})
+            result = True
+
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _get_updates(self, timeout):
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self._updates.get(), timeout or 0.01))
+        except asyncio.TimeoutError:
+            return updates
+        while not self._updates.empty():
+            updates.append(self._updates.get_nowait())
+        return updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    web.run_app(FakeTelegram().make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
+
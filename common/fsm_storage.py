@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Где хранятся состояния диалогов (FSM):
+#   memory                   - в памяти процесса (по умолчанию), теряются
+#                              при перезапуске, только для одного экземпляра
+#   redis://host:6379/0      - Redis, общий для экземпляров на разных машинах
+#                              (нужен пакет redis)
+#   sqlite:///path/fsm.db    - файл SQLite, общий для процессов на одной машине
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'memory')
+
+# Через сколько секунд без ответа брошенный диалог забывается
+FSM_TTL = int(os.getenv('FSM_TTL', '86400'))
+
+
+def create_storage(url=FSM_STORAGE, ttl=FSM_TTL):
+    if url == 'memory':
+        return MemoryStorage()
+
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        return RedisStorage.from_url(url, state_ttl=ttl, data_ttl=ttl)
+
+    if url.startswith('sqlite:///'):
+        return SqliteStorage(url[len('sqlite:///'):], ttl)
+
+    raise ValueError(f"Неизвестное хранилище FSM: {url}")
+
+
+# Хранилище FSM в файле SQLite. Несколько процессов бота на одной машине
+# открывают один файл, так что диалог, начатый в одном процессе, можно
+# продолжить в другом. Запросы sqlite3 блокирующие и выполняются в отдельном
+# потоке по одному. Запись без изменений дольше ttl секунд считается удалённой
+class SqliteStorage(BaseStorage):
+    # Как часто удалять из файла просроченные записи
+    PURGE_INTERVAL = 60
+
+    def __init__(self, path, ttl=FSM_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fsm')
+        self._conn = None
+        self._purged_at = 0.0
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            # WAL: читатели не ждут писателя из другого процесса
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm ("
+                "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}', "
+                "expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS fsm_expires_at ON fsm (expires_at)")
+            self._conn.commit()
+        return self._conn
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _read(self, key, column):
+        row = self._connect().execute(
+            f"SELECT {column} FROM fsm WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    # Записывает один столбец и продлевает срок жизни всей записи. У
+    # просроченной записи второй столбец сбрасывается, как если бы её не было
+    def _write(self, key, column, value):
+        other, empty = ('data', '{}') if column == 'state' else ('state', None)
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            f"INSERT INTO fsm (key, {column}, expires_at) VALUES (?, ?, ?) "
+            f"ON CONFLICT (key) DO UPDATE SET {column} = excluded.{column}, "
+            f"{other} = CASE WHEN fsm.expires_at > ? THEN fsm.{other} ELSE ? END, "
+            f"expires_at = excluded.expires_at",
+            (key, value, now + self.ttl, now, empty)
+        )
+        if now - self._purged_at > self.PURGE_INTERVAL:
+            conn.execute("DELETE FROM fsm WHERE expires_at <= ?", (now,))
+            self._purged_at = now
+        conn.commit()
+
+    async def set_state(self, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        await self._run(self._write, self.key_builder.build(key), 'state', state)
+
+    async def get_state(self, key):
+        return await self._run(self._read, self.key_builder.build(key), 'state')
+
+    async def set_data(self, key, data):
+        if not isinstance(data, dict):
+            raise TypeError(f"Данные FSM должны быть словарём, а не {type(data).__name__}")
+        await self._run(self._write, self.key_builder.build(key), 'data', json.dumps(data))
+
+    async def get_data(self, key):
+        data = await self._run(self._read, self.key_builder.build(key), 'data')
+        return json.loads(data) if data else {}
+
+    async def close(self):
+        if self._conn is None:
+            return
+        await self._run(self._conn.close)
+        self._conn = None
+        self._executor.shutdown(wait=True)
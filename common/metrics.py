@@ -0,0 +1,267 @@
+import bisect
+import contextvars
+import logging
+import os
+import time
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Порт локального эндпоинта /metrics в текстовом формате Prometheus.
+# Если не задан, метрики не собираются и замеры почти ничего не стоят
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+ENABLED = METRICS_PORT > 0
+
+# Границы корзин гистограмм в секундах
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Время во внешних системах за текущее обновление: {backend: секунды}
+_spent = contextvars.ContextVar('spent', default=None)
+
+
+def _labels(names, values):
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return ','.join(pairs)
+
+
+def _series(name, labels):
+    return f'{name}{{{labels}}}' if labels else name
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *labels):
+        self._values[labels] = self._values.get(labels, 0) + 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{_series(self.name, _labels(self.labels, labels))} {value}')
+        return lines
+
+
+# Значение, которое вычисляется при каждом чтении /metrics
+class Gauge:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.func = None
+
+    def set_function(self, func):
+        self.func = func
+
+    def render(self):
+        if self.func is None:
+            return []
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge',
+                f'{self.name} {self.func()}']
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # {метки: [число наблюдений по корзинам (последняя - +Inf), сумма]}
+        self._values = {}
+
+    def observe(self, value, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self._values.items()):
+            prefix = _labels(self.labels, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                bucket_labels = f'{prefix},le="{bound}"' if prefix else f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            lines.append(f'{_series(self.name + "_sum", prefix)} {total}')
+            lines.append(f'{_series(self.name + "_count", prefix)} {cumulative}')
+        return lines
+
+
+handler_seconds = Histogram(
+    'bot_handler_seconds', 'Время обработки обновления', ('handler',)
+)
+handler_errors = Counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках', ('handler', 'error')
+)
+handler_backend_seconds = Histogram(
+    'bot_handler_backend_seconds',
+    'Время во внешних системах за одно обновление', ('handler', 'backend')
+)
+backend_seconds = Histogram(
+    'bot_backend_seconds', 'Время одного обращения к внешней системе',
+    ('backend', 'operation')
+)
+backend_errors = Counter(
+    'bot_backend_errors_total', 'Ошибки обращений к внешним системам',
+    ('backend', 'operation', 'error')
+)
+outbox_delay_seconds = Histogram(
+    'bot_outbox_delay_seconds', 'Время от постановки сообщения в очередь до отправки', ()
+)
+outbox_errors = Counter(
+    'bot_outbox_errors_total', 'Сообщения, которые не удалось отправить', ('error',)
+)
+outbox_queue_depth = Gauge('bot_outbox_queue_depth', 'Сообщений в очереди на отправку')
+
+REGISTRY = [
+    handler_seconds, handler_errors, handler_backend_seconds, backend_seconds, backend_errors,
+    outbox_delay_seconds, outbox_errors, outbox_queue_depth
+]
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Замер обращения к БД, HTTP-сервису или Telegram:
+#   with timed('db', 'query'):
+#       cur.execute(...)
+# Работает и в обычном, и в асинхронном коде. Время добавляется к обработчику,
+# в котором выполняется замер (в потоках - если контекст скопирован)
+class _Timer:
+    __slots__ = ('backend', 'operation', 'start')
+
+    def __init__(self, backend, operation):
+        self.backend = backend
+        self.operation = operation
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        backend_seconds.observe(elapsed, self.backend, self.operation)
+        if exc_type is not None:
+            backend_errors.inc(self.backend, self.operation, exc_type.__name__)
+        spent = _spent.get()
+        if spent is not None:
+            spent[self.backend] = spent.get(self.backend, 0.0) + elapsed
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timed(backend, operation):
+    if not ENABLED:
+        return _NO_TIMER
+    return _Timer(backend, operation)
+
+
+# Курсор psycopg2, замеряющий каждый запрос. Передаётся в connect() как
+# cursor_factory; без метрик - None, то есть обычный курсор
+def db_cursor_factory():
+    if not ENABLED:
+        return None
+
+    from psycopg2.extensions import cursor
+
+    class TimedCursor(cursor):
+        def execute(self, query, vars=None):
+            with timed('db', 'query'):
+                return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            with timed('db', 'query'):
+                return super().executemany(query, vars_list)
+
+    return TimedCursor
+
+
+# Внутренний middleware диспетчера: время и ошибки каждого обработчика
+# и сколько из этого времени ушло на БД, HTTP и Telegram
+class HandlerMetrics(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        spent = {}
+        token = _spent.set(spent)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            handler_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - start, name)
+            for backend, seconds in spent.items():
+                handler_backend_seconds.observe(seconds, name, backend)
+            _spent.reset(token)
+
+
+# Middleware сессии бота: время каждого запроса к Bot API
+class TelegramMetrics(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        with timed('telegram', type(method).__name__):
+            return await make_request(bot, method)
+
+
+# Подключает метрики к диспетчеру и боту и поднимает /metrics на METRICS_PORT
+# вместе с диспетчером (у процессов common/runner.py - METRICS_PORT + номер
+# процесса). Без METRICS_PORT ничего не делает
+def setup_metrics(dp, bot):
+    if not ENABLED:
+        return
+
+    for name, observer in dp.observers.items():
+        if name not in ('update', 'error'):
+            observer.middleware(HandlerMetrics())
+    bot.session.middleware(TelegramMetrics())
+
+    runner = None
+
+    async def handle_metrics(request):
+        return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+    async def start(worker=0):
+        nonlocal runner
+        app = web.Application()
+        app.router.add_get('/metrics', handle_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        port = METRICS_PORT + worker
+        await web.TCPSite(runner, METRICS_HOST, port).start()
+        logger.info("Метрики: http://%s:%s/metrics", METRICS_HOST, port)
+
+    async def stop():
+        if runner is not None:
+            await runner.cleanup()
+
+    dp.startup.register(start)
+    dp.shutdown.register(stop)
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from common import metrics
+from common.ratelimit import TokenBucket, call_with_retry
+from common.runner import per_worker
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину одного сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+# Не больше OUTBOX_RATE сообщений в секунду от всего бота и одно сообщение
+# в OUTBOX_CHAT_INTERVAL секунд в один чат (рекомендации Bot API). При
+# BOT_WORKERS > 1 общий темп делится между процессами-обработчиками
+OUTBOX_RATE = float(os.getenv('OUTBOX_RATE', '25'))
+OUTBOX_CHAT_INTERVAL = float(os.getenv('OUTBOX_CHAT_INTERVAL', '1'))
+# Сколько чатов обслуживается одновременно
+OUTBOX_CONCURRENCY = int(os.getenv('OUTBOX_CONCURRENCY', '8'))
+
+
+# Отделяет от текста первую часть не длиннее limit, по возможности по
+# границе строки. Возвращает (часть, остаток)
+def split_first(text, limit=MAX_MESSAGE_LENGTH):
+    if len(text) <= limit:
+        return text, ''
+    cut = text.rfind('\n', 0, limit + 1)
+    if cut <= 0:
+        return text[:limit], text[limit:]
+    return text[:cut], text[cut + 1:]
+
+
+def split_text(text, limit=MAX_MESSAGE_LENGTH):
+    chunks = []
+    while text:
+        chunk, text = split_first(text, limit)
+        chunks.append(chunk)
+    return chunks
+
+
+# Сообщение в очереди: текст, параметры send_message и ожидающие отправки.
+# После склейки нескольких сообщений futures содержит их все
+class _Message:
+    __slots__ = ('text', 'kwargs', 'futures', 'queued_at')
+
+    def __init__(self, text, kwargs, futures, queued_at):
+        self.text = text
+        self.kwargs = kwargs
+        self.futures = futures
+        self.queued_at = queued_at
+
+
+# Очередь для длинных ответов и уведомлений, которые бот отправляет сам.
+# Длинный текст уходит несколькими сообщениями по границам строк, идущие
+# подряд сообщения в один чат с одинаковыми параметрами склеиваются, общий и
+# поканальный темп отправки ограничены, на flood control (retry_after)
+# отправка приостанавливается. Короткие ответы обработчиков идут напрямую
+# через message.answer: очередь их не видит, не учитывает в темпе и не
+# упорядочивает относительно своих сообщений, поэтому OUTBOX_RATE задаётся с
+# запасом, а обработчик отправляет через очередь только последний ответ.
+# send() возвращает future, которое завершается после отправки всего текста
+class Outbox:
+    def __init__(self, bot, rate=OUTBOX_RATE, chat_interval=OUTBOX_CHAT_INTERVAL,
+                 concurrency=OUTBOX_CONCURRENCY, retries=3):
+        self.bot = bot
+        self.bucket = TokenBucket(per_worker(rate))
+        self.chat_interval = chat_interval
+        self.concurrency = concurrency
+        self.retries = retries
+        # Очередь сообщений каждого чата; чат есть в словаре, пока у него
+        # есть неотправленные сообщения или идёт отправка
+        self._pending = {}
+        # Чаты, которым можно отправлять прямо сейчас
+        self._ready = asyncio.Queue()
+        self._next_send = {}
+        self._tasks = []
+        self.sent = 0
+        self.failed = 0
+        metrics.outbox_queue_depth.set_function(self.queued)
+
+    def send(self, chat_id, text, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        message = _Message(text, kwargs, [future], time.monotonic())
+        queue = self._pending.get(chat_id)
+        if queue is None:
+            self._pending[chat_id] = deque([message])
+            self._schedule(chat_id)
+        else:
+            queue.append(message)
+        return future
+
+    def queued(self):
+        return sum(len(queue) for queue in self._pending.values())
+
+    def stats(self):
+        return {
+            'queued': self.queued(),
+            'chats': len(self._pending),
+            'sent': self.sent,
+            'failed': self.failed
+        }
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    # Ждёт отправки накопленного, но не дольше timeout секунд
+    async def close(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+
+    def _schedule(self, chat_id):
+        delay = self._next_send.get(chat_id, 0) - time.monotonic()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    # Забирает из начала очереди чата сообщения с одинаковыми параметрами
+    # и склеивает их в одно
+    def _take(self, queue):
+        message = queue.popleft()
+        while queue and queue[0].kwargs == message.kwargs:
+            other = queue.popleft()
+            message = _Message(
+                f'{message.text}\n{other.text}', message.kwargs,
+                message.futures + other.futures, message.queued_at
+            )
+        return message
+
+    async def _work(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._pending[chat_id]
+            message = self._take(queue)
+            chunk, rest = split_first(message.text)
+            # Клавиатура и прочие параметры - у последней части
+            kwargs = message.kwargs if not rest else {}
+
+            try:
+                await call_with_retry(
+                    lambda: self.bot.send_message(chat_id, chunk, **kwargs),
+                    self.bucket,
+                    self.retries
+                )
+            except Exception as e:
+                self.failed += len(message.futures)
+                if metrics.ENABLED:
+                    metrics.outbox_errors.inc(type(e).__name__)
+                logger.warning("Не удалось отправить сообщение в чат %s: %r", chat_id, e)
+                for future in message.futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                if rest:
+                    queue.appendleft(_Message(rest, message.kwargs, message.futures, message.queued_at))
+                else:
+                    self.sent += len(message.futures)
+                    if metrics.ENABLED:
+                        metrics.outbox_delay_seconds.observe(time.monotonic() - message.queued_at)
+                    for future in message.futures:
+                        if not future.done():
+                            future.set_result(None)
+
+            self._next_send[chat_id] = time.monotonic() + self.chat_interval
+            if queue:
+                self._schedule(chat_id)
+            else:
+                del self._pending[chat_id]
+                # Пауза для чата уже прошла бы к следующему сообщению
+                self._forget_later(chat_id)
+
+    def _forget_later(self, chat_id):
+        def forget():
+            if chat_id not in self._pending:
+                self._next_send.pop(chat_id, None)
+
+        asyncio.get_running_loop().call_later(self.chat_interval, forget)
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+# Ведро токенов: не больше rate вызовов в секунду с запасом на всплеск
+# в capacity вызовов. block() приостанавливает все вызовы, например
+# на время, указанное Telegram в ответе 429 (retry_after)
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def block(self, seconds):
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+# Вызывает func() с учётом ведра; на TelegramRetryAfter останавливает
+# ведро на указанное время и повторяет вызов
+async def call_with_retry(func, bucket, retries=3):
+    attempt = 0
+    while True:
+        await bucket.acquire()
+        try:
+            return await func()
+        except TelegramRetryAfter as e:
+            if attempt >= retries:
+                raise
+            attempt += 1
+            logger.warning("Flood control, пауза %s с", e.retry_after)
+            bucket.block(e.retry_after)
+
+
+# Применяет func к каждому элементу items: не больше concurrency вызовов
+# одновременно и не быстрее, чем позволяет bucket. Ошибка для одного
+# элемента не останавливает остальные. progress(done, failed, total)
+# вызывается после каждого элемента. Возвращает (успешных, с ошибкой)
+async def fan_out(items, func, bucket, concurrency=5, retries=3, progress=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    total = len(items)
+    done = 0
+    failed = 0
+
+    async def run(item):
+        nonlocal done, failed
+        async with semaphore:
+            try:
+                await call_with_retry(lambda: func(item), bucket, retries)
+            except Exception:
+                failed += 1
+                logger.exception("Ошибка при обработке %r", item)
+            done += 1
+            if progress is not None:
+                progress(done, failed, total)
+
+    await asyncio.gather(*(run(item) for item in items))
+    return done - failed, failed
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from aiohttp import web
+
+from common.webhook import BOT_MODE, WEBHOOK_PATH, WEBHOOK_SECRET, serve_webhook, wait_for_stop
+
+logger = logging.getLogger(__name__)
+
+# Сколько процессов обрабатывают обновления; 1 - всё в одном процессе
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+# Процесс, не подававший признаков жизни столько секунд, перезапускается
+WORKER_TIMEOUT = float(os.getenv('WORKER_TIMEOUT', '30'))
+# Сколько секунд даётся новому процессу на импорт модуля бота до первого сигнала
+WORKER_START_TIMEOUT = float(os.getenv('WORKER_START_TIMEOUT', '60'))
+HEARTBEAT_INTERVAL = 1.0
+POLLING_TIMEOUT = 30
+
+
+# Доля процесса-обработчика в лимите, который действует на бота целиком
+# (например, общий темп отправки сообщений): при BOT_WORKERS процессах
+# каждый получает limit / BOT_WORKERS. Поканальные лимиты делить не нужно:
+# все обновления чата обрабатывает один процесс
+def per_worker(limit):
+    return limit / max(BOT_WORKERS, 1)
+
+
+# Поля обновления, в которых лежит объект с чатом или отправителем
+_CHAT_FIELDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post',
+                'business_message', 'edited_business_message')
+
+
+# Чат, к которому относится обновление; для inline-запросов и других
+# обновлений без чата - отправитель
+def chat_id_of(update):
+    for field in _CHAT_FIELDS:
+        if field in update:
+            return update[field]['chat']['id']
+
+    for field, value in update.items():
+        if not isinstance(value, dict):
+            continue
+        message = value.get('message')
+        if isinstance(message, dict) and 'chat' in message:
+            return message['chat']['id']
+        if 'chat' in value:
+            return value['chat']['id']
+        if 'from' in value:
+            return value['from']['id']
+    return 0
+
+
+# Процесс-обработчик глазами главного процесса: очередь его обновлений,
+# канал до процесса и время последнего сигнала от него
+class Worker:
+    def __init__(self, context, index, names):
+        self.context = context
+        self.index = index
+        self.names = names
+        self.updates = asyncio.Queue()
+        self.heartbeat = context.Value('d', 0.0, lock=False)
+        self.process = None
+        self.conn = None
+        self.started_at = None
+
+    def start(self):
+        reader, writer = self.context.Pipe(duplex=False)
+        self.heartbeat.value = 0.0
+        self.started_at = time.time()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(self.names, self.index, reader, self.heartbeat),
+            name=f'bot-worker-{self.index}',
+            daemon=True
+        )
+        self.process.start()
+        reader.close()
+        self.conn = writer
+
+    def is_healthy(self):
+        if not self.process.is_alive():
+            return False
+        if self.heartbeat.value == 0.0:
+            return time.time() - self.started_at < WORKER_START_TIMEOUT
+        return time.time() - self.heartbeat.value < WORKER_TIMEOUT
+
+    def restart(self):
+        logger.warning("Обработчик %s не отвечает (код %s), перезапуск",
+                       self.index, self.process.exitcode)
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.start()
+
+    # Передаёт обновления процессу по порядку. Если процесс умер на
+    # середине, обновление уходит в перезапущенный процесс
+    async def feed(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            update = await self.updates.get()
+            while True:
+                conn = self.conn
+                try:
+                    await loop.run_in_executor(None, conn.send, update)
+                    break
+                except (OSError, ValueError):
+                    await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    def stop(self, timeout):
+        self.conn.close()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+# Главный процесс получает обновления один раз (polling или вебхук) и
+# раздаёт их workers процессам по хэшу chat_id: все обновления одного чата
+# попадают в один процесс и обрабатываются там по порядку, так что состояние
+# FSM и порядок ответов сохраняются. Процессы запускаются заново (spawn) и
+# берут dp и bot из модуля бота; startup/shutdown диспетчера выполняются
+# в каждом процессе, номер процесса передаётся в них как worker
+async def run_workers(dp, bot, workers):
+    main_module = sys.modules['__main__']
+    names = (_name_in(main_module, dp), _name_in(main_module, bot))
+    context = multiprocessing.get_context('spawn')
+
+    pool = [Worker(context, index, names) for index in range(workers)]
+    for worker in pool:
+        worker.start()
+    tasks = [asyncio.create_task(worker.feed()) for worker in pool]
+    tasks.append(asyncio.create_task(_watch(pool)))
+    logger.info("Запущено обработчиков: %s", workers)
+
+    def dispatch(update):
+        pool[hash(chat_id_of(update)) % workers].updates.put_nowait(update)
+
+    allowed_updates = dp.resolve_used_update_types()
+    try:
+        if BOT_MODE == 'webhook':
+            await serve_webhook(_webhook_app(dispatch), bot, allowed_updates)
+        else:
+            await _poll(bot, allowed_updates, dispatch)
+    finally:
+        # Уже принятые обновления успевают уйти в процессы
+        deadline = time.monotonic() + WORKER_TIMEOUT
+        while any(not worker.updates.empty() for worker in pool) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in tasks:
+            task.cancel()
+        for worker in pool:
+            worker.stop(timeout=POLLING_TIMEOUT)
+
+
+def _name_in(module, value):
+    for name, attr in vars(module).items():
+        if attr is value:
+            return name
+    raise RuntimeError("Для запуска в нескольких процессах dp и bot должны быть "
+                       "глобальными переменными запускаемого модуля")
+
+
+# Проверка здоровья процессов-обработчиков
+async def _watch(pool):
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        for worker in pool:
+            if not worker.is_healthy():
+                worker.restart()
+
+
+def _webhook_app(dispatch):
+    async def handle(request):
+        if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        dispatch(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    return app
+
+
+async def _poll(bot, allowed_updates, dispatch):
+    async def poll():
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates
+                )
+            except Exception as e:
+                logger.error("Ошибка получения обновлений: %r", e)
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                continue
+            for update in updates:
+                dispatch(update.model_dump(mode='json', exclude_unset=True, by_alias=True))
+                offset = update.update_id + 1
+
+    task = asyncio.create_task(poll())
+    try:
+        await wait_for_stop()
+    finally:
+        task.cancel()
+        await bot.session.close()
+
+
+def _worker_main(names, index, conn, heartbeat):
+    # Остановкой управляет главный процесс: закрывает канал
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    module = sys.modules['__mp_main__']
+    dp, bot = getattr(module, names[0]), getattr(module, names[1])
+    asyncio.run(_work(dp, bot, index, conn, heartbeat))
+
+
+async def _work(dp, bot, index, conn, heartbeat):
+    loop = asyncio.get_running_loop()
+
+    async def beat():
+        while True:
+            heartbeat.value = time.time()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    beat_task = asyncio.create_task(beat())
+    workflow_data = {'dispatcher': dp, 'bots': [bot], 'worker': index, **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+
+    # Последняя задача каждого чата: следующее обновление чата ждёт её,
+    # обновления разных чатов обрабатываются одновременно
+    chats = {}
+
+    async def handle(update, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception:
+            logger.exception("Ошибка обработки обновления %s", update.get('update_id'))
+
+    def forget(chat_id, task):
+        if chats.get(chat_id) is task:
+            del chats[chat_id]
+
+    try:
+        while True:
+            try:
+                update = await loop.run_in_executor(None, conn.recv)
+            except EOFError:
+                break
+            chat_id = chat_id_of(update)
+            task = asyncio.create_task(handle(update, chats.get(chat_id)))
+            chats[chat_id] = task
+            task.add_done_callback(lambda task, chat_id=chat_id: forget(chat_id, task))
+    finally:
+        if chats:
+            await asyncio.wait(list(chats.values()))
+        beat_task.cancel()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await bot.session.close()
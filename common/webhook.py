@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+import signal
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Публичный адрес, по которому Telegram (или балансировщик перед ботами)
+# доставляет обновления; если не задан, вебхук в Telegram не регистрируется
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+# Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token каждого запроса
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+# Сколько секунд при остановке ждать завершения начатых обработчиков
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv('WEBHOOK_SHUTDOWN_TIMEOUT', '10'))
+
+# Адрес Bot API; для локальной проверки - адрес common/fake_telegram.py
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+
+def create_bot(token):
+    session = None
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL, is_local=True))
+    return Bot(token=token, session=session)
+
+
+# Запускает бота в режиме из BOT_MODE и работает до остановки. При
+# BOT_WORKERS > 1 обновления обрабатывают несколько процессов (common/runner.py)
+async def run_bot(dp, bot, **kwargs):
+    # Импорт здесь: runner сам использует функции этого модуля
+    from common.runner import BOT_WORKERS, run_workers
+
+    if BOT_WORKERS > 1:
+        await run_workers(dp, bot, BOT_WORKERS)
+    elif BOT_MODE == 'webhook':
+        await run_webhook(dp, bot, **kwargs)
+    else:
+        await dp.start_polling(bot, **kwargs)
+
+
+# Ждёт SIGINT или SIGTERM
+async def wait_for_stop():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+
+# Поднимает приложение aiohttp на WEBHOOK_HOST:WEBHOOK_PORT, регистрирует
+# вебхук и работает до сигнала остановки. Несколько экземпляров бота могут
+# стоять за одним балансировщиком: каждый при старте регистрирует один
+# и тот же адрес и не удаляет вебхук при остановке
+async def serve_webhook(app, bot, allowed_updates):
+    runner = web.AppRunner(app, shutdown_timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info("Вебхук слушает %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            WEBHOOK_BASE_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates
+        )
+
+    try:
+        await wait_for_stop()
+    finally:
+        logger.info("Остановка вебхука")
+        await runner.cleanup()
+        await bot.session.close()
+
+
+# Приложение aiohttp, которое принимает обновления от Telegram на WEBHOOK_PATH
+def create_webhook_app(dp, bot, **kwargs):
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        **kwargs
+    ).register(app, path=WEBHOOK_PATH)
+    # Вызывает startup/shutdown диспетчера вместе с приложением
+    setup_application(app, dp, bot=bot, **kwargs)
+    return app
+
+
+# Локальный веб-сервер aiohttp принимает обновления от Telegram
+async def run_webhook(dp, bot, **kwargs):
+    app = create_webhook_app(dp, bot, **kwargs)
+    await serve_webhook(app, bot, dp.resolve_used_update_types())
@@ -1,18 +1,24 @@
 import asyncio
 import os
-from aiogram import Bot, Dispatcher, types
+from aiogram import Dispatcher, types
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-from aiogram.filters.command import Command
+from aiogram.filters.command import Command, CommandObject
 from dotenv import load_dotenv
 
+from common.conversion import (
+    CONVERT_USAGE, INLINE_CACHE_TIME, format_conversions, inline_article, parse_conversions
+)
+from common.fsm_storage import create_storage
+from common.webhook import create_bot, run_bot
+
 load_dotenv()  # Загружает переменные из .env
 BOT_TOKEN = os.getenv("BOT_TOKEN")  # Получает токен
 
 # Получение токена из переменного окружения
 BOT_TOKEN = os.getenv('BOT_TOKEN')
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+bot = create_bot(BOT_TOKEN)
+dp = Dispatcher(storage=create_storage())
 
 # Словарь для хранения курсов валют
 currencies = {}
@@ -37,7 +43,8 @@ async def cmd_start(message: types.Message):
         "Привет! Я бот для конвертации валют.\n"
         "Чтобы продолжить, выберите одну из команд:\n"
         "/save_currency - сохранить курс валюты\n"
-        "/convert - конвертировать валюту в рубли"
+        "/convert - конвертировать валюту в рубли\n"
+        f"Можно сразу: {CONVERT_USAGE}"
     )
 
 # /save_currency
@@ -73,14 +80,28 @@ async def process_currency_rate(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("Ошибка! Введите число.")
 
-# /convert
+# Конвертация всех пар из текста вида "100 USD, 50 EUR" по сохранённым курсам
+
+
+def convert_text(text):
+    pairs = parse_conversions(text)
+    if pairs is None:
+        return None
+    pairs = [(amount, currency_name.upper()) for amount, currency_name in pairs]
+    return format_conversions(pairs, currencies.get)
+
+# /convert, а также /convert 100 USD, 50 EUR - сразу без диалога
 
 
 @dp.message(Command("convert"))
-async def cmd_convert(message: types.Message, state: FSMContext):
+async def cmd_convert(message: types.Message, state: FSMContext, command: CommandObject):
     if not currencies:
         await message.answer("Нет сохранённых валют. Сначала используйте /save_currency.")
         return
+    if command.args:
+        result = convert_text(command.args)
+        await message.answer(result or f"Не удалось разобрать запрос. Пример: {CONVERT_USAGE}")
+        return
     await message.answer("Введите название валюты для конвертации:")
     await state.set_state(CurrencyStates.waiting_for_convert_currency)
 
@@ -114,8 +135,18 @@ async def process_convert_amount(message: types.Message, state: FSMContext):
         await message.answer("Ошибка! Введите число.")
 
 
+# Inline-режим: @бот 100 USD, 50 EUR в любом чате
+
+
+@dp.inline_query()
+async def inline_convert(inline_query: types.InlineQuery):
+    result = convert_text(inline_query.query)
+    results = [inline_article("Конвертация в рубли", result)] if result else []
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME)
+
+
 async def main():
-    await dp.start_polling(bot)
+    await run_bot(dp, bot)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,12 @@
 import asyncio
+import bisect
+import json
+import logging
 import os
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Dispatcher, types, F
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-from aiogram.filters.command import Command
+from aiogram.filters.command import Command, CommandObject
 from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
@@ -14,48 +17,404 @@ from aiogram.types import (
 )
 from dotenv import load_dotenv
 import psycopg2
+from psycopg2 import extensions
+
+from common.alerts import ALERT_USAGE, Alert, Alerts
+from common.conversion import (
+    CONVERT_USAGE, INLINE_CACHE_TIME, format_conversions, inline_article, parse_conversions
+)
+from common.fsm_storage import create_storage
+from common.metrics import setup_metrics
+from common.outbox import Outbox
+from common.ratelimit import TokenBucket, fan_out
+from common.webhook import create_bot, run_bot
+
+from lab5.db import Database, get_db_connection
 
 load_dotenv()
 
 # Выгрузка токена из виртуального окружения
 BOT_TOKEN = os.getenv('BOT_TOKEN')
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+bot = create_bot(BOT_TOKEN)
+dp = Dispatcher(storage=create_storage())
+setup_metrics(dp, bot)
+# Длинные ответы и уведомления уходят через очередь common.outbox с учётом
+# лимитов Telegram
+outbox = Outbox(bot)
 
-# Подключаем данные из виртуального окружения
+# Как часто перечитывать список администраторов, если уведомление потерялось
+ADMINS_TTL = float(os.getenv('ADMINS_TTL', '60'))
+ADMINS_CHANNEL = 'admins_changed'
 
+# Как часто сверять каталог валют в памяти с таблицей currencies
+CATALOG_RECONCILE_INTERVAL = float(os.getenv('CATALOG_RECONCILE_INTERVAL', '300'))
+CURRENCIES_CHANNEL = 'currencies_changed'
+ALERTS_CHANNEL = 'alerts_changed'
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.environ['DB_HOST'],
-        port=os.environ['DB_PORT'],
-        user=os.environ['DB_USER'],
-        password=os.environ['DB_PASSWORD'],
-        database=os.environ['DB_NAME']
-    )
+# Через сколько секунд переподключаться к LISTEN после обрыва соединения
+LISTEN_RETRY = float(os.getenv('LISTEN_RETRY', '5'))
+
+# Рассылка команд администраторам: одновременных запросов и запросов в секунду
+COMMANDS_CONCURRENCY = int(os.getenv('COMMANDS_CONCURRENCY', '5'))
+COMMANDS_RATE = float(os.getenv('COMMANDS_RATE', '20'))
+
+# Общий пул соединений; запросы выполняются вне цикла событий
+db = Database()
 
 # Инициализация базы данных
 
 
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
+def create_notify_trigger(cur, table, channel):
+    # Любое изменение таблицы table сообщает процессам бота через NOTIFY channel
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_{channel}() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{channel}', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute(f"DROP TRIGGER IF EXISTS {channel} ON {table}")
+    cur.execute(
+        f"CREATE TRIGGER {channel} "
+        f"AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+        f"FOR EACH STATEMENT EXECUTE PROCEDURE notify_{channel}()"
+    )
+
+
+# Подписки на курсы: /alert USD > 95
+def create_alerts_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS alerts (
+            id SERIAL PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            currency_name VARCHAR NOT NULL,
+            op CHAR(1) NOT NULL,
+            threshold NUMERIC NOT NULL
+        )
+    """)
+    # Подписки хранятся в памяти каждого процесса бота: о каждой новой и
+    # удалённой подписке остальные узнают из уведомления "INSERT {строка}"
+    # или "DELETE {строка}"
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_{ALERTS_CHANNEL}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('{ALERTS_CHANNEL}', TG_OP || ' ' || row_to_json(OLD)::text);
+            ELSE
+                PERFORM pg_notify('{ALERTS_CHANNEL}', TG_OP || ' ' || row_to_json(NEW)::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute(f"DROP TRIGGER IF EXISTS {ALERTS_CHANNEL} ON alerts")
+    cur.execute(
+        f"CREATE TRIGGER {ALERTS_CHANNEL} AFTER INSERT OR DELETE ON alerts "
+        f"FOR EACH ROW EXECUTE PROCEDURE notify_{ALERTS_CHANNEL}()"
+    )
+
+
+def create_schema(cur):
+    # Процессы-обработчики стартуют одновременно: схема меняется по очереди
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('bot5_init'))")
+    # Нужен для INSERT ... ON CONFLICT (currency_name) при добавлении валюты
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS currencies_currency_name_key "
+        "ON currencies (currency_name)"
+    )
+    create_notify_trigger(cur, 'admins', ADMINS_CHANNEL)
+    create_notify_trigger(cur, 'currencies', CURRENCIES_CHANNEL)
+    create_alerts_table(cur)
+
+
+async def init_db():
+    db.open()
+    await db.transaction(create_schema)
+
+# Уведомления из триггеров БД. Одно выделенное соединение слушает все каналы;
+# на пачку уведомлений канала вызывается его обработчик handler(payloads) со
+# списком строк payload. Если соединение оборвалось, через retry секунд оно
+# открывается заново, а каждый обработчик получает payloads=None: уведомления
+# за время обрыва потеряны, данные нужно перечитать целиком
+
+
+class Notifications:
+    def __init__(self, retry):
+        self.retry = retry
+        self._handlers = {}
+        self._conn = None
+        self._task = None
+        self._calls = set()
+
+    def listen(self, channel, handler):
+        self._handlers[channel] = handler
+
+    def _call(self, handler, payloads):
+        task = asyncio.ensure_future(handler(payloads))
+        self._calls.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self._calls.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning("Не удалось обработать уведомление: %r", task.exception())
+
+    def _on_notify(self):
+        try:
+            self._conn.poll()
+        except psycopg2.Error:
+            # Соединение оборвалось: переподключимся на следующем шаге run()
+            self._disconnect()
+            return
+        payloads = {}
+        for notify in self._conn.notifies:
+            payloads.setdefault(notify.channel, []).append(notify.payload)
+        self._conn.notifies.clear()
+        for channel, channel_payloads in payloads.items():
+            self._call(self._handlers[channel], channel_payloads)
+
+    async def _connect(self):
+        def connect():
+            conn = get_db_connection()
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                for channel in self._handlers:
+                    cur.execute(f"LISTEN {channel}")
+            return conn
+
+        self._conn = await db.run_sync(connect)
+        asyncio.get_running_loop().add_reader(self._conn.fileno(), self._on_notify)
+
+    def _disconnect(self):
+        asyncio.get_running_loop().remove_reader(self._conn.fileno())
+        self._conn.close()
+        self._conn = None
+
+    # Подписка начинается до первой загрузки данных, чтобы не пропустить
+    # изменения между загрузкой и LISTEN
+    async def start(self):
+        await self._connect()
+        self._task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.retry)
+            if self._conn is not None:
+                continue
+            try:
+                await self._connect()
+            except psycopg2.Error:
+                continue
+            for handler in self._handlers.values():
+                self._call(handler, None)
+
+    async def close(self):
+        tasks = list(self._calls)
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._conn is not None:
+            self._disconnect()
+
+
+notifications = Notifications(LISTEN_RETRY)
+
+# Администраторы в памяти: список загружается при старте, перечитывается
+# по уведомлению из триггера на admins и не реже чем раз в ttl секунд
+
+
+class AdminCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.chat_ids = set()
+        self._task = None
+
+    async def load(self):
+        rows = await db.fetchall("SELECT chat_id FROM admins")
+        self.chat_ids = {str(row[0]) for row in rows}
+
+    def __contains__(self, chat_id):
+        return str(chat_id) in self.chat_ids
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.ttl)
+            try:
+                await self.load()
+            except psycopg2.Error:
+                # Остаётся прежний список, повторим через ttl
+                pass
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+admins = AdminCache(ADMINS_TTL)
+notifications.listen(ADMINS_CHANNEL, lambda payloads: admins.load())
+
+# Каталог валют в памяти: курс по названию и отсортированный список названий.
+# Загружается при старте, изменения из админских команд записываются сюда
+# сразу после записи в БД. Изменения из других процессов бота приходят
+# уведомлением из триггера на currencies, а раз в interval секунд каталог
+# сверяется с БД на случай, если уведомление потерялось.
+# О каждом изменении курса (кроме первой загрузки) сообщает on_change(название,
+# старый курс или None, новый курс)
+
+
+class CurrencyCatalog:
+    def __init__(self, interval, on_change=None):
+        self.interval = interval
+        self.on_change = on_change
+        self._loaded = False
+        self._rates = {}
+        self._names = []
+        self._pending = None
+        self._task = None
+        # Уведомление и периодическая сверка не перечитывают каталог одновременно
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        async with self._lock:
+            # Изменения, сделанные пока идёт чтение, накладываются поверх него
+            self._pending = {}
+            try:
+                rows = await db.fetchall("SELECT currency_name, rate FROM currencies")
+            except BaseException:
+                self._pending = None
+                raise
+
+            rates = dict(rows)
+            for name, rate in self._pending.items():
+                if rate is None:
+                    rates.pop(name, None)
+                else:
+                    rates[name] = rate
+            self._pending = None
+
+            previous = self._rates
+            self._rates = rates
+            self._names = sorted(rates)
+
+            # Курсы, изменённые в обход этого процесса
+            if self._loaded and self.on_change is not None:
+                for name, rate in rates.items():
+                    if previous.get(name) != rate:
+                        self.on_change(name, previous.get(name), rate)
+            self._loaded = True
+
+    def get(self, currency_name):
+        return self._rates.get(currency_name)
+
+    def __contains__(self, currency_name):
+        return currency_name in self._rates
+
+    def __len__(self):
+        return len(self._rates)
+
+    def items(self):
+        return [(name, self._rates[name]) for name in self._names]
+
+    def set(self, currency_name, rate):
+        old = self._rates.get(currency_name)
+        if old is None:
+            bisect.insort(self._names, currency_name)
+        self._rates[currency_name] = rate
+        if self._pending is not None:
+            self._pending[currency_name] = rate
+        if self.on_change is not None and old != rate:
+            self.on_change(currency_name, old, rate)
+
+    def remove(self, currency_name):
+        if self._rates.pop(currency_name, None) is not None:
+            self._names.pop(bisect.bisect_left(self._names, currency_name))
+        if self._pending is not None:
+            self._pending[currency_name] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.load()
+            except psycopg2.Error:
+                pass
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+# Хранилище подписок common.alerts.Alerts в таблице alerts. Удаление с
+# RETURNING сообщает, какие подписки удалил именно этот процесс
+
+
+class AlertStore:
+    async def all(self):
+        rows = await db.fetchall("SELECT id, chat_id, currency_name, op, threshold FROM alerts")
+        return [
+            Alert(alert_id, chat_id, currency_name, op, float(threshold))
+            for alert_id, chat_id, currency_name, op, threshold in rows
+        ]
+
+    async def add(self, chat_id, currency_name, op, threshold):
+        row = await db.fetchone(
+            "INSERT INTO alerts (chat_id, currency_name, op, threshold) "
+            "VALUES (%s, %s, %s, %s) RETURNING id",
+            (chat_id, currency_name, op, threshold)
+        )
+        return Alert(row[0], chat_id, currency_name, op, threshold)
+
+    async def delete(self, alert_ids, chat_id=None):
+        if chat_id is None:
+            rows = await db.fetchall(
+                "DELETE FROM alerts WHERE id = ANY(%s) RETURNING id", (list(alert_ids),)
+            )
+        else:
+            rows = await db.fetchall(
+                "DELETE FROM alerts WHERE id = ANY(%s) AND chat_id = %s RETURNING id",
+                (list(alert_ids), chat_id)
+            )
+        return [row[0] for row in rows]
+
+
+alerts = Alerts(AlertStore(), outbox.send)
+catalog = CurrencyCatalog(CATALOG_RECONCILE_INTERVAL, on_change=alerts.on_rate_change)
+notifications.listen(CURRENCIES_CHANNEL, lambda payloads: catalog.load())
 
-    conn.commit()
-    cur.close()
-    conn.close()
+
+async def on_alerts_changed(payloads):
+    if payloads is None:
+        await alerts.load()
+        return
+    for payload in payloads:
+        action, row = payload.split(' ', 1)
+        row = json.loads(row)
+        if action == 'DELETE':
+            alerts.forget(row['id'])
+        else:
+            alerts.remember(Alert(
+                row['id'], row['chat_id'], row['currency_name'], row['op'], float(row['threshold'])
+            ))
+
+
+notifications.listen(ALERTS_CHANNEL, on_alerts_changed)
 
 # Проверка на права администратора
 
 
 def is_admin(chat_id: str) -> bool:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM admins WHERE chat_id = %s", (str(chat_id),))
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
-    return result is not None
+    return chat_id in admins
 
 # Состояния FSM
 
@@ -79,12 +438,14 @@ admin_commands = [
     BotCommand(command="manage_currency", description="Управление валютами - администратор"),
     BotCommand(command="get_currencies", description="Список всех валют"),
     BotCommand(command="convert", description="Конвертация валют"),
+    BotCommand(command="alert", description="Уведомления об изменении курса"),
 ]
 
 user_commands = [
     BotCommand(command="start", description="Начать работу"),
     BotCommand(command="get_currencies", description="Список всех валют"),
     BotCommand(command="convert", description="Конвертация валют"),
+    BotCommand(command="alert", description="Уведомления об изменении курса"),
 ]
 
 # Функция для установки команд бота
@@ -93,20 +454,26 @@ user_commands = [
 async def setup_bot_commands():
     await bot.set_my_commands(user_commands, scope=BotCommandScopeDefault())
 
-    # Устанавливаем команды для всех админов
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT chat_id FROM admins")
-    admin_chat_ids = [row[0] for row in cur.fetchall()]
-    cur.close()
-    conn.close()
-
-    for chat_id in admin_chat_ids:
+    # Устанавливаем команды для всех админов: параллельно, но не быстрее
+    # COMMANDS_RATE запросов в секунду и с паузой при flood control
+    async def set_admin_commands(chat_id):
         await bot.set_my_commands(
             admin_commands,
             scope=BotCommandScopeChat(chat_id=chat_id)
         )
 
+    def report(done, failed, total):
+        if done == total or done % 50 == 0:
+            logging.info("Команды администраторов: %s из %s, ошибок %s", done, total, failed)
+
+    await fan_out(
+        list(admins.chat_ids),
+        set_admin_commands,
+        TokenBucket(COMMANDS_RATE),
+        concurrency=COMMANDS_CONCURRENCY,
+        progress=report
+    )
+
 # Команда /start
 
 
@@ -118,14 +485,18 @@ async def cmd_start(message: types.Message):
             "Доступные команды:\n"
             "/manage_currency - управление валютами\n"
             "/get_currencies - список всех валют\n"
-            "/convert - конвертировать валюту в рубли"
+            "/convert - конвертировать валюту в рубли\n"
+            f"Можно сразу: {CONVERT_USAGE}\n"
+            f"{ALERT_USAGE} - сообщить, когда курс станет больше 95"
         )
     else:
         await message.answer(
             "Привет! Я бот для конвертации валют.\n"
             "Доступные команды:\n"
             "/get_currencies - список всех валют\n"
-            "/convert - конвертировать валюту в рубли"
+            "/convert - конвертировать валюту в рубли\n"
+            f"Можно сразу: {CONVERT_USAGE}\n"
+            f"{ALERT_USAGE} - сообщить, когда курс станет больше 95"
         )
 
 # Команда /get_currencies
@@ -133,36 +504,39 @@ async def cmd_start(message: types.Message):
 
 @dp.message(Command("get_currencies"))
 async def cmd_get_currencies(message: types.Message):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT currency_name, rate FROM currencies ORDER BY currency_name")
-    currencies = cur.fetchall()
-    cur.close()
-    conn.close()
+    currencies = catalog.items()
 
     if not currencies:
         await message.answer("Нет доступных валют.")
         return
 
-    response = "Список доступных валют:\n"
-    for currency in currencies:
-        response += f"{currency[0]}: {currency[1]} RUB\n"
+    lines = ["Список доступных валют:"]
+    lines.extend(f"{name}: {rate} RUB" for name, rate in currencies)
+
+    await outbox.send(message.chat.id, "\n".join(lines))
+
+# Конвертация всех пар из текста вида "100 USD, 50 EUR" по каталогу
 
-    await message.answer(response)
 
-# Команда /convert
+def convert_text(text):
+    pairs = parse_conversions(text)
+    if pairs is None:
+        return None
+    pairs = [(amount, currency_name.upper()) for amount, currency_name in pairs]
+    return format_conversions(pairs, catalog.get)
+
+# Команда /convert, а также /convert 100 USD, 50 EUR - сразу без диалога
 
 
 @dp.message(Command("convert"))
-async def cmd_convert(message: types.Message, state: FSMContext):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT currency_name FROM currencies")
-    if not cur.fetchall():
+async def cmd_convert(message: types.Message, state: FSMContext, command: CommandObject):
+    if not catalog:
         await message.answer("Нет доступных валют. Необходимо добавить валюту.")
-        cur.close()
-        conn.close()
+        return
+
+    if command.args:
+        result = convert_text(command.args)
+        await message.answer(result or f"Не удалось разобрать запрос. Пример: {CONVERT_USAGE}")
         return
 
     await message.answer("Введите название валюты для конвертации:")
@@ -173,19 +547,14 @@ async def cmd_convert(message: types.Message, state: FSMContext):
 async def process_convert_currency(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT rate FROM currencies WHERE currency_name = %s", (currency_name,))
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
+    rate = catalog.get(currency_name)
 
-    if not result:
+    if rate is None:
         await message.answer("Данная валюта не найдена")
         return
 
-    await state.update_data(currency_name=currency_name, rate=result[0])
+    # Курс хранится строкой: данные FSM могут сохраняться в JSON
+    await state.update_data(currency_name=currency_name, rate=str(rate))
     await message.answer(f"Введите сумму в {currency_name}:")
     await state.set_state(CurrencyStates.waiting_for_convert_amount)
 
@@ -203,6 +572,39 @@ async def process_convert_amount(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("Ошибка, попробуйте заново")
 
+# Inline-режим: @бот 100 USD, 50 EUR в любом чате
+
+
+@dp.inline_query()
+async def inline_convert(inline_query: types.InlineQuery):
+    result = convert_text(inline_query.query)
+    results = [inline_article("Конвертация в рубли", result)] if result else []
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME)
+
+# Валюта для подписки: название в каталоге и текущий курс
+
+
+async def find_currency(currency_name):
+    currency_name = currency_name.upper()
+    if currency_name not in catalog:
+        return None
+    return currency_name, catalog.get(currency_name)
+
+# Команда /alert: без аргументов - список подписок чата,
+# /alert USD > 95 - новая подписка
+
+
+@dp.message(Command("alert"))
+async def cmd_alert(message: types.Message, command: CommandObject):
+    await message.answer(await alerts.command(message.chat.id, command.args, find_currency))
+
+# Команда /unalert номер - удаление подписки
+
+
+@dp.message(Command("unalert"))
+async def cmd_unalert(message: types.Message, command: CommandObject):
+    await message.answer(await alerts.unalert_command(message.chat.id, command.args))
+
 # Настройка команды /manage_currency
 @dp.message(Command("manage_currency"))
 async def cmd_manage_currency(message: types.Message):
@@ -242,14 +644,8 @@ async def add_currency_start(message: types.Message, state: FSMContext):
 async def add_currency_name(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM currencies WHERE currency_name = %s",
-                (currency_name,))
-    if cur.fetchone():
+    if currency_name in catalog:
         await message.answer("Данная валюта уже существует")
-        cur.close()
-        conn.close()
         await state.clear()
         return
 
@@ -269,15 +665,17 @@ async def add_currency_rate(message: types.Message, state: FSMContext):
     data = await state.get_data()
     currency_name = data['currency_name']
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s)",
+    row = await db.fetchone(
+        "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s) "
+        "ON CONFLICT (currency_name) DO NOTHING RETURNING rate",
         (currency_name, rate)
     )
-    conn.commit()
-    cur.close()
-    conn.close()
+    if row is None:
+        # Валюту добавили, пока вводился курс
+        await message.answer("Данная валюта уже существует")
+        await state.clear()
+        return
+    catalog.set(currency_name, row[0])
 
     await message.answer(f"Валюта: {currency_name} успешно добавлена")
     await state.clear()
@@ -298,14 +696,9 @@ async def delete_currency_start(message: types.Message, state: FSMContext):
 async def delete_currency(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM currencies WHERE currency_name = %s",
-                (currency_name,))
-    deleted_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
+    deleted_rows = await db.execute(
+        "DELETE FROM currencies WHERE currency_name = %s", (currency_name,))
+    catalog.remove(currency_name)
 
     if deleted_rows > 0:
         await message.answer(f"Валюта {currency_name} успешно удалена")
@@ -330,14 +723,8 @@ async def update_currency_start(message: types.Message, state: FSMContext):
 async def update_currency_name(message: types.Message, state: FSMContext):
     currency_name = message.text.upper()
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM currencies WHERE currency_name = %s",
-                (currency_name,))
-    if not cur.fetchone():
+    if currency_name not in catalog:
         await message.answer("Данная валюта не существует")
-        cur.close()
-        conn.close()
         await state.clear()
         return
 
@@ -357,26 +744,60 @@ async def update_currency_rate(message: types.Message, state: FSMContext):
     data = await state.get_data()
     currency_name = data['currency_name']
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE currencies SET rate = %s WHERE currency_name = %s",
+    row = await db.fetchone(
+        "UPDATE currencies SET rate = %s WHERE currency_name = %s RETURNING rate",
         (rate, currency_name)
     )
-    conn.commit()
-    cur.close()
-    conn.close()
+    if row:
+        catalog.set(currency_name, row[0])
+    else:
+        catalog.remove(currency_name)
 
     await message.answer(f"Курс валюты {currency_name} успешно изменен")
     await state.clear()
 
+# Подготовка при старте: выполняется в каждом процессе, который обрабатывает
+# обновления (при BOT_WORKERS > 1 их несколько, worker - номер процесса)
+
+commands_task = None
+
+
+@dp.startup()
+async def on_startup(worker=0):
+    global commands_task
+    await init_db()  # Инициализация базы данных
+    await notifications.start()  # Уведомления об изменениях в БД
+    await admins.load()  # Загрузка списка администраторов
+    admins.start()  # Фоновое обновление списка администраторов
+    await catalog.load()  # Загрузка каталога валют
+    await alerts.load()  # Загрузка подписок на курсы
+    catalog.start()  # Периодическая сверка каталога с БД
+    await outbox.start()
+    # Команды бота устанавливаются в фоне и только одним процессом,
+    # получение обновлений стартует сразу
+    if worker == 0:
+        commands_task = asyncio.create_task(setup_bot_commands())
+
+
+@dp.shutdown()
+async def on_shutdown():
+    if commands_task is not None:
+        commands_task.cancel()
+        await asyncio.gather(commands_task, return_exceptions=True)
+    # Сначала всё, что обращается к БД в фоне, и соединение LISTEN, затем пул
+    await notifications.close()
+    await admins.close()
+    await catalog.close()
+    await alerts.close()
+    await outbox.close()
+    db.close()
+
 # Запуск бота
 
 
 async def main():
-    init_db()  # Инициализация базы данных
-    await setup_bot_commands()  # Установка команд бота
-    await dp.start_polling(bot)
+    await run_bot(dp, bot)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from dotenv import load_dotenv
+
+from common.metrics import db_cursor_factory, timed
+
+load_dotenv()
+
+# Подключаем данные из виртуального окружения
+DB_CONFIG = {
+    'host': os.environ['DB_HOST'],
+    'port': os.environ['DB_PORT'],
+    'user': os.environ['DB_USER'],
+    'password': os.environ['DB_PASSWORD'],
+    'database': os.environ['DB_NAME']
+}
+
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+
+
+def get_db_connection():
+    return psycopg2.connect(**DB_CONFIG)
+
+
+# Доступ к БД для обработчиков бота. Запросы psycopg2 блокирующие, поэтому
+# выполняются в пуле потоков, а не в цикле событий aiogram. Потоков столько
+# же, сколько соединений в пуле, так что соединение всегда найдётся, а лишние
+# запросы ждут своей очереди в исполнителе
+class Database:
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._pool = None
+        self._executor = ThreadPoolExecutor(max_workers=maxconn, thread_name_prefix='db')
+
+    def open(self):
+        self._pool = ThreadedConnectionPool(
+            self.minconn, self.maxconn, cursor_factory=db_cursor_factory(), **DB_CONFIG
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._pool is not None:
+            self._pool.closeall()
+
+    # Соединение из пула на одну транзакцию: фиксируется при успехе,
+    # откатывается при ошибке и в любом случае возвращается в пул
+    @contextmanager
+    def connection(self):
+        with timed('db', 'connect'):
+            conn = self._pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self._pool.putconn(conn, close=bool(conn.closed))
+
+    # Выполняет блокирующую функцию в пуле потоков. Контекст копируется,
+    # чтобы время запросов засчитывалось вызвавшему обработчику
+    async def run_sync(self, func, *args):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, func, *args)
+
+    # Выполняет func(cur) в одной транзакции и возвращает её результат
+    async def transaction(self, func):
+        def run():
+            with self.connection() as conn:
+                with conn.cursor() as cur:
+                    return func(cur)
+
+        return await self.run_sync(run)
+
+    async def fetchall(self, query, params=None):
+        def run(cur):
+            cur.execute(query, params)
+            return cur.fetchall()
+
+        return await self.transaction(run)
+
+    async def fetchone(self, query, params=None):
+        def run(cur):
+            cur.execute(query, params)
+            return cur.fetchone()
+
+        return await self.transaction(run)
+
+    # Возвращает число затронутых строк
+    async def execute(self, query, params=None):
+        def run(cur):
+            cur.execute(query, params)
+            return cur.rowcount
+
+        return await self.transaction(run)
@@ -0,0 +1,60 @@
+import sqlite3
+
+from common.alerts import Alert
+
+
+# Хранилище подписок common.alerts.Alerts в локальном файле SQLite: у
+# сервисов lab6 нет для них таблицы, а боту нужно пережить перезапуск.
+# Файл открывается при первом обращении; запросы короткие и выполняются
+# прямо в цикле событий
+class AlertStore:
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS alerts ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, "
+                "currency_name TEXT NOT NULL, op TEXT NOT NULL, threshold REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    async def all(self):
+        rows = self._connect().execute(
+            "SELECT id, chat_id, currency_name, op, threshold FROM alerts"
+        ).fetchall()
+        return [Alert(*row) for row in rows]
+
+    async def add(self, chat_id, currency_name, op, threshold):
+        conn = self._connect()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO alerts (chat_id, currency_name, op, threshold) VALUES (?, ?, ?, ?)",
+                (chat_id, currency_name, op, threshold)
+            )
+        return Alert(cur.lastrowid, chat_id, currency_name, op, threshold)
+
+    # Удаляет подписки и возвращает id тех, что ещё были в файле
+    async def delete(self, alert_ids, chat_id=None):
+        conn = self._connect()
+        deleted = []
+        with conn:
+            for alert_id in alert_ids:
+                if chat_id is None:
+                    cur = conn.execute("DELETE FROM alerts WHERE id = ?", (alert_id,))
+                else:
+                    cur = conn.execute(
+                        "DELETE FROM alerts WHERE id = ? AND chat_id = ?", (alert_id, chat_id)
+                    )
+                if cur.rowcount:
+                    deleted.append(alert_id)
+        return deleted
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import time
+
+import psycopg2
+
+from common.benchmark import bench_http, report
+from lab6.db import DB_CONFIG, ConnectionPool
+
+# Запрос, который выполняет /convert для каждой конвертации
+QUERY = "SELECT rate FROM currencies WHERE currency_name = %s"
+
+
+# Как было: новое подключение на каждый запрос
+def bench_connect(requests_count, currency):
+    timings = []
+    for _ in range(requests_count):
+        started = time.perf_counter()
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(QUERY, (currency,))
+                cur.fetchone()
+        finally:
+            conn.close()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+# Как стало: соединение берётся из пула
+def bench_pool(requests_count, currency):
+    pool = ConnectionPool(DB_CONFIG, minconn=1, maxconn=1)
+    timings = []
+    try:
+        for _ in range(requests_count):
+            started = time.perf_counter()
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(QUERY, (currency,))
+                    cur.fetchone()
+            timings.append(time.perf_counter() - started)
+    finally:
+        pool.closeall()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочные замеры сервисов lab6")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pool_parser = commands.add_parser(
+        "pool", help="задержка запроса к БД с пулом соединений и без него"
+    )
+    pool_parser.add_argument("-n", "--requests", type=int, default=500)
+    pool_parser.add_argument("-c", "--currency", default="USD")
+
+    http_parser = commands.add_parser(
+        "http", help="запросы в секунду и p99 для запущенного сервиса"
+    )
+    http_parser.add_argument(
+        "--url", default="http://localhost:5002/convert?currency=USD&amount=100"
+    )
+    http_parser.add_argument("-n", "--requests", type=int, default=10000)
+    http_parser.add_argument("-c", "--concurrency", type=int, default=64)
+
+    args = parser.parse_args()
+
+    if args.command == "pool":
+        report("psycopg2.connect", bench_connect(args.requests, args.currency))
+        report("ConnectionPool", bench_pool(args.requests, args.currency))
+    else:
+        timings, elapsed, errors = asyncio.run(
+            bench_http(args.url, args.requests, args.concurrency)
+        )
+        # Запускается одинаково против Flask-версии (python data_manager.py)
+        # и ASGI-версии (data_manager_async.py)
+        report(f"HTTP c={args.concurrency}", timings, elapsed)
+        if errors:
+            print(f"Ошибочных ответов: {errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,151 @@
+import asyncio
 import os
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+import time
+from urllib.parse import quote
+from aiogram import Dispatcher, types, F
+from aiogram.filters import Command, CommandObject, ExceptionTypeFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
-import requests
 from dotenv import load_dotenv
 
+from common.alerts import Alerts
+from common.conversion import (
+    CONVERT_USAGE, INLINE_CACHE_TIME, format_conversions, inline_article, parse_conversions
+)
+from common.fsm_storage import create_storage
+from common.metrics import setup_metrics
+from common.outbox import Outbox
+from common.webhook import create_bot, run_bot
+
+from lab6.alert_store import AlertStore
+from lab6.http_client import HttpClient, ServiceError
+
 load_dotenv()
 
 # Конфигурация
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CURRENCY_SERVICE_URL = "http://localhost:5001"
 DATA_SERVICE_URL = "http://localhost:5002"
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+CURRENCY_CACHE_TTL = float(os.getenv("CURRENCY_CACHE_TTL", "300"))
+# Файл с подписками /alert и как часто проверять курсы на изменения
+ALERTS_DB = os.getenv("ALERTS_DB", "alerts.db")
+ALERT_POLL_INTERVAL = float(os.getenv("ALERT_POLL_INTERVAL", "30"))
 
 # Инициализация бота и диспетчера
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+bot = create_bot(BOT_TOKEN)
+dp = Dispatcher(storage=create_storage())
+setup_metrics(dp, bot)
+
+# Общий HTTP-клиент для обоих сервисов: запросы не блокируют цикл событий
+http = HttpClient(timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES)
+
+# Уведомления уходят через очередь common.outbox с учётом лимитов Telegram
+outbox = Outbox(bot)
+
+
+# Названия валют, про которые бот уже знает, что они есть в каталоге.
+# Запись живёт ttl секунд: валюту могли удалить в обход бота
+class KnownCurrencies:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._expires = {}
+
+    def add(self, currency_name):
+        self._expires[currency_name.lower()] = time.monotonic() + self.ttl
+
+    def discard(self, currency_name):
+        self._expires.pop(currency_name.lower(), None)
+
+    def __contains__(self, currency_name):
+        key = currency_name.lower()
+        expires = self._expires.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self._expires[key]
+            return False
+        return True
+
+
+known_currencies = KnownCurrencies(CURRENCY_CACHE_TTL)
+
+
+# Проверка существования валюты: сначала локальный кэш, затем HEAD-запрос
+# к точечному поиску data_manager без учёта регистра
+async def currency_exists(currency_name):
+    if currency_name in known_currencies:
+        return True
+
+    response = await http.head(
+        f"{DATA_SERVICE_URL}/currencies/{quote(currency_name, safe='')}"
+    )
+    if response.status == 200:
+        known_currencies.add(currency_name)
+        return True
+    return False
+
+
+# Подписки всех чатов: индекс в памяти, копия в файле ALERTS_DB
+alert_store = AlertStore(ALERTS_DB)
+alerts = Alerts(alert_store, outbox.send)
+
+
+# Следит за курсами data_manager: раз в interval секунд (или сразу после
+# изменения курса через бота) запрашивает /currencies с версией каталога в
+# If-None-Match. Пока каталог не менялся, сервис отвечает 304 без тела; на
+# новую версию курсы сравниваются с прошлыми и проверяются подписки
+class RateWatcher:
+    def __init__(self, interval):
+        self.interval = interval
+        self._rates = None
+        self._version = None
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def poke(self):
+        self._wake.set()
+
+    async def check(self):
+        headers = None
+        if self._version is not None:
+            headers = {"If-None-Match": f'"v{self._version}"'}
+        response = await http.get(f"{DATA_SERVICE_URL}/currencies", headers=headers)
+        if response.status != 200:
+            return
+
+        rates = {c["currency_name"]: c["rate"] for c in response.data.get("currencies", [])}
+        self._version = response.data.get("version")
+        previous, self._rates = self._rates, rates
+        if previous is None:
+            return
+        for name, rate in rates.items():
+            if previous.get(name) != rate:
+                alerts.on_rate_change(name, previous.get(name), rate)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def run(self):
+        while True:
+            try:
+                await self.check()
+            except ServiceError:
+                pass
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+
+watcher = RateWatcher(ALERT_POLL_INTERVAL)
 
 
 # Состояния FSM
@@ -82,17 +211,13 @@ async def process_currency_name(message: types.Message, state: FSMContext):
 
     if data.get("action") == "add":
         # Проверка существования валюты
-        response = requests.get(f"{DATA_SERVICE_URL}/currencies")
-        if response.status_code == 200:
-            currencies = response.json().get("currencies", [])
-            for currency in currencies:
-                if currency["currency_name"].lower() == message.text.lower():
-                    await message.answer(
-                        "Данная валюта уже существует",
-                        reply_markup=get_manage_kb()
-                    )
-                    await state.clear()
-                    return
+        if await currency_exists(message.text):
+            await message.answer(
+                "Данная валюта уже существует",
+                reply_markup=get_manage_kb()
+            )
+            await state.clear()
+            return
 
     await state.update_data(currency_name=message.text)
     await message.answer("Введите курс к рублю:")
@@ -108,21 +233,24 @@ async def process_currency_rate(message: types.Message, state: FSMContext):
         action = data["action"]
 
         if action == "add":
-            response = requests.post(
+            response = await http.post(
                 f"{CURRENCY_SERVICE_URL}/load",
                 json={"currency_name": currency_name, "rate": rate},
             )
-            if response.status_code == 200:
+            if response.status == 200:
+                known_currencies.add(currency_name)
+                watcher.poke()
                 await message.answer(
                     f"Валюта: {currency_name} успешно добавлена",
                     reply_markup=get_manage_kb()
                 )
         elif action == "update":
-            response = requests.post(
+            response = await http.post(
                 f"{CURRENCY_SERVICE_URL}/update_currency",
                 json={"currency_name": currency_name, "new_rate": rate},
             )
-            if response.status_code == 200:
+            if response.status == 200:
+                watcher.poke()
                 await message.answer(
                     f"Курс валюты {currency_name} успешно обновлен",
                     reply_markup=get_manage_kb()
@@ -146,12 +274,13 @@ async def delete_currency_start(message: types.Message, state: FSMContext):
 @dp.message(CurrencyStates.waiting_for_delete_currency, F.text)
 async def process_delete_currency(message: types.Message, state: FSMContext):
     currency_name = message.text
-    response = requests.post(
+    response = await http.post(
         f"{CURRENCY_SERVICE_URL}/delete",
         json={"currency_name": currency_name},
     )
 
-    if response.status_code == 200:
+    if response.status == 200:
+        known_currencies.discard(currency_name)
         await message.answer(
             f"Валюта {currency_name} успешно удалена",
             reply_markup=get_manage_kb()
@@ -176,9 +305,11 @@ async def update_currency_start(message: types.Message, state: FSMContext):
 # Получение списка валют
 @dp.message(Command("get_currencies"))
 async def cmd_get_currencies(message: types.Message):
-    response = requests.get(f"{DATA_SERVICE_URL}/currencies")
-    if response.status_code == 200:
-        currencies = response.json().get("currencies", [])
+    response = await http.get(f"{DATA_SERVICE_URL}/currencies")
+    if response.status == 200:
+        currencies = response.data.get("currencies", [])
+        for currency in currencies:
+            known_currencies.add(currency["currency_name"])
         if currencies:
             message_text = "Список валют:\n" + "\n".join(
                 [f"{c['currency_name']}: {c['rate']} RUB" for c in currencies]
@@ -191,9 +322,40 @@ async def cmd_get_currencies(message: types.Message):
     await message.answer(message_text, reply_markup=get_main_kb())
 
 
-# Конвертация валюты
+# Конвертация всех пар из текста вида "100 USD, 50 EUR" одним запросом
+# к /convert/batch. Возвращает None, если текст не разобран
+async def convert_text(text):
+    pairs = parse_conversions(text)
+    if pairs is None:
+        return None
+
+    response = await http.post(
+        f"{DATA_SERVICE_URL}/convert/batch",
+        json={"items": [
+            {"currency": currency_name, "amount": amount} for amount, currency_name in pairs
+        ]},
+    )
+    if response.status != 200:
+        return "Ошибка конвертации, попробуйте позже"
+
+    rates = {
+        item["currency"]: item["rate"]
+        for item in response.data["results"] if "rate" in item
+    }
+    return format_conversions(pairs, rates.get)
+
+
+# Конвертация валюты: /convert 100 USD, 50 EUR отвечает сразу, без диалога
 @dp.message(Command("convert"))
-async def cmd_convert(message: types.Message, state: FSMContext):
+async def cmd_convert(message: types.Message, state: FSMContext, command: CommandObject):
+    if command.args:
+        result = await convert_text(command.args)
+        await message.answer(
+            result or f"Не удалось разобрать запрос. Пример: {CONVERT_USAGE}",
+            reply_markup=get_main_kb()
+        )
+        return
+
     await message.answer(
         "Введите название валюты:",
         reply_markup=types.ReplyKeyboardRemove()
@@ -215,13 +377,13 @@ async def process_convert_amount(message: types.Message, state: FSMContext):
         data = await state.get_data()
         currency = data["currency"]
 
-        response = requests.get(
+        response = await http.get(
             f"{DATA_SERVICE_URL}/convert",
             params={"currency": currency, "amount": amount},
         )
 
-        if response.status_code == 200:
-            result = response.json()
+        if response.status == 200:
+            result = response.data
             await message.answer(
                 f"{amount} {currency} = {result['converted_amount']} RUB",
                 reply_markup=get_main_kb()
@@ -237,11 +399,61 @@ async def process_convert_amount(message: types.Message, state: FSMContext):
         await message.answer("Пожалуйста, введите число:")
 
 
+# Inline-режим: @бот 100 USD, 50 EUR в любом чате
+@dp.inline_query()
+async def inline_convert(inline_query: types.InlineQuery):
+    result = await convert_text(inline_query.query)
+    results = [inline_article("Конвертация в рубли", result)] if result else []
+    await inline_query.answer(results, cache_time=INLINE_CACHE_TIME)
+
+
+# Название из каталога и курс: подписка сверяется с каталогом без учёта
+# регистра ввода
+async def find_currency(currency_name):
+    response = await http.get(f"{DATA_SERVICE_URL}/currencies/{quote(currency_name, safe='')}")
+    if response.status != 200:
+        return None
+    return response.data["currency_name"], response.data["rate"]
+
+
+# /alert - список подписок чата, /alert USD > 95 - новая подписка
+@dp.message(Command("alert"))
+async def cmd_alert(message: types.Message, command: CommandObject):
+    await message.answer(await alerts.command(message.chat.id, command.args, find_currency))
+
+
+@dp.message(Command("unalert"))
+async def cmd_unalert(message: types.Message, command: CommandObject):
+    await message.answer(await alerts.unalert_command(message.chat.id, command.args))
+
+
+@dp.startup()
+async def on_startup():
+    await alerts.load()
+    await outbox.start()
+    watcher.start()
+
+
+@dp.shutdown()
+async def on_shutdown():
+    watcher.stop()
+    await alerts.close()
+    await outbox.close()
+    alert_store.close()
+    # Здесь, а не в main(): процессы-обработчики runner не вызывают main()
+    await http.close()
+
+
+# Сервис не ответил даже после повторов
+@dp.error(ExceptionTypeFilter(ServiceError))
+async def service_error(event: types.ErrorEvent):
+    if event.update.message:
+        await event.update.message.answer("Сервис временно недоступен, попробуйте позже")
+
+
 async def main():
-    await dp.start_polling(bot)
+    await run_bot(dp, bot)
 
 
 if __name__ == "__main__":
-    import asyncio
-
     asyncio.run(main())
\ No newline at end of file
@@ -1,26 +1,16 @@
 from flask import Flask, request, jsonify
-import psycopg2
-import os
-from dotenv import load_dotenv
+from psycopg2.extras import execute_values
 
-# Загружаем переменные окружения из файла .env
-load_dotenv()
+from db import create_pool, ensure_schema, notify_currencies_changed
+from payloads import parse_currencies
 
 app = Flask(__name__)
 
-# Конфигурация подключения к БД через переменные окружения
-DB_CONFIG = {
-    'host': os.environ['DB_HOST'],
-    'port': os.environ['DB_PORT'],
-    'user': os.environ['DB_USER'],
-    'password': os.environ['DB_PASSWORD'],
-    'database': os.environ['DB_NAME']
-}
+# Общий пул соединений вместо нового подключения на каждый запрос
+pool = create_pool()
+ensure_schema(pool)
 
 
-def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
-
 @app.after_request
 def add_charset(response):
     response.headers["Content-Type"] = "application/json; charset=utf-8"
@@ -29,61 +19,86 @@ def add_charset(response):
 
 @app.route('/load', methods=['POST'])
 def load_currency():
-    data = request.get_json()
-    currency_name = data.get('currency_name')
-    rate = data.get('rate')
-
-    if not currency_name or not rate:
-        return jsonify({'error': 'Необходимо указать currency_name и rate'}), 400
+    pairs, is_batch, error = parse_currencies(request.get_json(silent=True), 'rate')
+    if error:
+        return jsonify({'error': error}), 400
 
     try:
-        with get_db_connection() as conn:
+        with pool.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT 1 FROM currencies WHERE currency_name = %s",
-                    (currency_name,)
-                )
-                if cur.fetchone():
-                    return jsonify({'error': 'Валюта уже существует'}), 400
-
-                cur.execute(
-                    "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s)",
-                    (currency_name, rate)
+                if not is_batch:
+                    # Одна валюта: существующую не перезаписываем
+                    cur.execute(
+                        "INSERT INTO currencies (currency_name, rate) VALUES (%s, %s) "
+                        "ON CONFLICT (currency_name) DO NOTHING",
+                        pairs[0]
+                    )
+                    if cur.rowcount == 0:
+                        return jsonify({'error': 'Валюта уже существует'}), 400
+                    notify_currencies_changed(cur)
+                    conn.commit()
+                    return jsonify({'message': 'Валюта успешно добавлена'}), 200
+
+                # Пакет: загружаем весь список курсов одним запросом,
+                # xmax = 0 только у строк, вставленных этим запросом
+                rows = execute_values(
+                    cur,
+                    "INSERT INTO currencies (currency_name, rate) VALUES %s "
+                    "ON CONFLICT (currency_name) DO UPDATE SET rate = EXCLUDED.rate "
+                    "RETURNING currency_name, (xmax = 0)",
+                    pairs,
+                    page_size=len(pairs),
+                    fetch=True
                 )
+                notify_currencies_changed(cur)
                 conn.commit()
-        return jsonify({'message': 'Валюта успешно добавлена'}), 200
+
+        return jsonify({
+            'message': 'Курсы валют успешно загружены',
+            'created': [name for name, created in rows if created],
+            'updated': [name for name, created in rows if not created]
+        }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/update_currency', methods=['POST'])
 def update_currency():
-    data = request.get_json()
-    currency_name = data.get('currency_name')
-    new_rate = data.get('new_rate')
-
-    if not currency_name or not new_rate:
-        return jsonify({'error': 'Необходимо указать currency_name и new_rate'}), 400
+    pairs, is_batch, error = parse_currencies(request.get_json(silent=True), 'new_rate')
+    if error:
+        return jsonify({'error': error}), 400
 
     try:
-        with get_db_connection() as conn:
+        with pool.connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT 1 FROM currencies WHERE currency_name = %s",
-                    (currency_name,)
+                rows = execute_values(
+                    cur,
+                    "UPDATE currencies AS c SET rate = v.rate::numeric "
+                    "FROM (VALUES %s) AS v (currency_name, rate) "
+                    "WHERE c.currency_name = v.currency_name "
+                    "RETURNING c.currency_name",
+                    pairs,
+                    page_size=len(pairs),
+                    fetch=True
                 )
-                if not cur.fetchone():
-                    return jsonify({'error': 'Валюта не найдена'}), 404
-
-                cur.execute(
-                    "UPDATE currencies SET rate = %s WHERE currency_name = %s",
-                    (new_rate, currency_name)
-                )
-                conn.commit()
-        return jsonify({'message': 'Курс валюты успешно обновлен'}), 200
+                if rows:
+                    notify_currencies_changed(cur)
+                    conn.commit()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    updated = {row[0] for row in rows}
+    if not is_batch:
+        if not updated:
+            return jsonify({'error': 'Валюта не найдена'}), 404
+        return jsonify({'message': 'Курс валюты успешно обновлен'}), 200
+
+    return jsonify({
+        'message': 'Курсы валют успешно обновлены',
+        'updated': [name for name, _ in pairs if name in updated],
+        'missing': [name for name, _ in pairs if name not in updated]
+    }), 200
+
 
 @app.route('/delete', methods=['POST'])
 def delete_currency():
@@ -94,24 +109,26 @@ def delete_currency():
         return jsonify({'error': 'Необходимо указать currency_name'}), 400
 
     try:
-        with get_db_connection() as conn:
+        with pool.connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    "SELECT 1 FROM currencies WHERE currency_name = %s",
+                    "DELETE FROM currencies WHERE currency_name = %s",
                     (currency_name,)
                 )
-                if not cur.fetchone():
+                if cur.rowcount == 0:
                     return jsonify({'error': 'Валюта не найдена'}), 404
 
-                cur.execute(
-                    "DELETE FROM currencies WHERE currency_name = %s",
-                    (currency_name,)
-                )
+                notify_currencies_changed(cur)
                 conn.commit()
         return jsonify({'message': 'Валюта успешно удалена'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/pool_stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify(pool.stats()), 200
+
+
 if __name__ == '__main__':
     app.run(port=5001, debug=True)
\ No newline at end of file
@@ -0,0 +1,149 @@
+# ASGI-версия currency_manager.py на Quart и asyncpg с теми же маршрутами
+# и JSON-ответами. Запуск в несколько процессов:
+#   uvicorn currency_manager_async:app --port 5001 --workers 4
+import os
+
+from quart import Quart, request, jsonify
+
+from db_async import acquire, create_pool, ensure_schema, notify_currencies_changed, pool_stats
+from payloads import parse_currencies
+
+app = Quart(__name__)
+
+ASGI_WORKERS = int(os.getenv('ASGI_WORKERS', '4'))
+
+# Пул создаётся в каждом рабочем процессе при старте
+pool = None
+
+
+@app.before_serving
+async def startup():
+    global pool
+    pool = await create_pool()
+    await ensure_schema(pool)
+
+
+@app.after_serving
+async def shutdown():
+    await pool.close()
+
+
+@app.after_request
+async def add_charset(response):
+    response.headers["Content-Type"] = "application/json; charset=utf-8"
+    return response
+
+
+@app.route('/load', methods=['POST'])
+async def load_currency():
+    pairs, is_batch, error = parse_currencies(await request.get_json(silent=True), 'rate')
+    if error:
+        return jsonify({'error': error}), 400
+
+    names = [name for name, _ in pairs]
+    rates = [str(rate) for _, rate in pairs]
+
+    try:
+        async with acquire(pool) as conn:
+            async with conn.transaction():
+                if not is_batch:
+                    # Одна валюта: существующую не перезаписываем
+                    inserted = await conn.fetchval(
+                        "INSERT INTO currencies (currency_name, rate) VALUES ($1, $2::numeric) "
+                        "ON CONFLICT (currency_name) DO NOTHING RETURNING true",
+                        names[0], rates[0]
+                    )
+                    if not inserted:
+                        return jsonify({'error': 'Валюта уже существует'}), 400
+                    await notify_currencies_changed(conn)
+                    return jsonify({'message': 'Валюта успешно добавлена'}), 200
+
+                # Пакет: загружаем весь список курсов одним запросом,
+                # xmax = 0 только у строк, вставленных этим запросом
+                rows = await conn.fetch(
+                    "INSERT INTO currencies (currency_name, rate) "
+                    "SELECT v.currency_name, v.rate::numeric "
+                    "FROM unnest($1::text[], $2::text[]) AS v (currency_name, rate) "
+                    "ON CONFLICT (currency_name) DO UPDATE SET rate = EXCLUDED.rate "
+                    "RETURNING currency_name, (xmax = 0) AS created",
+                    names, rates
+                )
+                await notify_currencies_changed(conn)
+
+        return jsonify({
+            'message': 'Курсы валют успешно загружены',
+            'created': [row['currency_name'] for row in rows if row['created']],
+            'updated': [row['currency_name'] for row in rows if not row['created']]
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/update_currency', methods=['POST'])
+async def update_currency():
+    pairs, is_batch, error = parse_currencies(await request.get_json(silent=True), 'new_rate')
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        async with acquire(pool) as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    "UPDATE currencies AS c SET rate = v.rate::numeric "
+                    "FROM unnest($1::text[], $2::text[]) AS v (currency_name, rate) "
+                    "WHERE c.currency_name = v.currency_name "
+                    "RETURNING c.currency_name",
+                    [name for name, _ in pairs],
+                    [str(rate) for _, rate in pairs]
+                )
+                if rows:
+                    await notify_currencies_changed(conn)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    updated = {row['currency_name'] for row in rows}
+    if not is_batch:
+        if not updated:
+            return jsonify({'error': 'Валюта не найдена'}), 404
+        return jsonify({'message': 'Курс валюты успешно обновлен'}), 200
+
+    return jsonify({
+        'message': 'Курсы валют успешно обновлены',
+        'updated': [name for name, _ in pairs if name in updated],
+        'missing': [name for name, _ in pairs if name not in updated]
+    }), 200
+
+
+@app.route('/delete', methods=['POST'])
+async def delete_currency():
+    data = await request.get_json()
+    currency_name = data.get('currency_name')
+
+    if not currency_name:
+        return jsonify({'error': 'Необходимо указать currency_name'}), 400
+
+    try:
+        async with acquire(pool) as conn:
+            async with conn.transaction():
+                deleted = await conn.fetchval(
+                    "DELETE FROM currencies WHERE currency_name = $1 RETURNING true",
+                    currency_name
+                )
+                if not deleted:
+                    return jsonify({'error': 'Валюта не найдена'}), 404
+
+                await notify_currencies_changed(conn)
+        return jsonify({'message': 'Валюта успешно удалена'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/pool_stats', methods=['GET'])
+async def get_pool_stats():
+    return jsonify(pool_stats(pool)), 200
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run('currency_manager_async:app', port=5001, workers=ASGI_WORKERS)
@@ -1,23 +1,150 @@
-from flask import Flask, request, jsonify
-import psycopg2
+import json
 import os
-from dotenv import load_dotenv
+import threading
+import time
 
-load_dotenv()
+from flask import Flask, Response, request, jsonify
+
+from db import DB_CONFIG, CHANGES_CHANNEL, ChangeListener, create_pool, ensure_schema
+from payloads import batch_currency_names, build_snapshot, convert_items
 
 app = Flask(__name__)
 
-DB_CONFIG = {
-    'host': os.environ['DB_HOST'],
-    'port': os.environ['DB_PORT'],
-    'user': os.environ['DB_USER'],
-    'password': os.environ['DB_PASSWORD'],
-    'database': os.environ['DB_NAME']
-}
+pool = create_pool()
+ensure_schema(pool)
+
+# Время жизни кэша курсов на случай пропущенного уведомления (0 - без кэша)
+RATE_CACHE_TTL = float(os.getenv('RATE_CACHE_TTL', '300'))
+
+# Максимальное число пар в одном запросе /convert/batch
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '10000'))
+
+# Размер страницы GET /currencies?after=...&limit=...
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '1000'))
+
+# Сколько строк потоковый режим забирает с сервера БД за раз
+STREAM_FETCH_SIZE = 1000
+
+
+# Таблица курсов в памяти процесса. Загружается при старте, перечитывается
+# по уведомлению от currency_manager и не реже чем раз в ttl секунд
+class RateCache:
+    def __init__(self, pool, ttl):
+        self._pool = pool
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._snapshot = None
+        self._loaded_at = None
+        self._generation = 0
+
+    def _is_fresh(self):
+        return (self._loaded_at is not None
+                and time.monotonic() - self._loaded_at < self.ttl)
+
+    def load(self, force=True):
+        # Перечитывает таблицу один поток, остальные ждут его результат
+        with self._reload_lock:
+            with self._lock:
+                if not force and self._is_fresh():
+                    return self._snapshot
+                generation = self._generation
+
+            with self._pool.connection() as conn:
+                with conn.cursor() as cur:
+                    # Версия и курсы читаются из одного снимка БД
+                    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                    cur.execute("SELECT version, updated_at FROM catalog_version")
+                    version, last_modified = cur.fetchone()
+                    cur.execute(
+                        "SELECT currency_name, rate FROM currencies ORDER BY currency_name"
+                    )
+                    rates = {name: float(rate) for name, rate in cur.fetchall()}
+
+            snapshot = build_snapshot(version, last_modified, rates)
+
+            with self._lock:
+                self._snapshot = snapshot
+                # Уведомление, пришедшее во время чтения, оставляет кэш устаревшим
+                if generation == self._generation:
+                    self._loaded_at = time.monotonic()
+            return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = None
+
+    def refresh(self, payload=None):
+        # В уведомлении приходит новая версия каталога; уже загруженную пропускаем
+        with self._lock:
+            current = self._snapshot
+        if payload and current is not None and int(payload) <= current.version:
+            return
+
+        self.invalidate()
+        try:
+            self.load()
+        except Exception:
+            # Следующий запрос попробует перечитать таблицу сам
+            pass
+
+    def snapshot(self):
+        with self._lock:
+            if self._is_fresh():
+                return self._snapshot
+        return self.load(force=False)
 
+    def rates(self):
+        return self.snapshot().rates
 
-def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
+    def get(self, currency_name):
+        return self.rates().get(currency_name)
+
+
+rate_cache = None
+if RATE_CACHE_TTL > 0:
+    rate_cache = RateCache(pool, RATE_CACHE_TTL)
+    rate_cache.load()
+    ChangeListener(DB_CONFIG, CHANGES_CHANNEL, rate_cache.refresh).start()
+
+
+def get_rates(currency_names):
+    if rate_cache is not None:
+        rates = rate_cache.rates()
+        return {name: rates[name] for name in currency_names if name in rates}
+
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT currency_name, rate FROM currencies WHERE currency_name = ANY(%s)",
+                (list(set(currency_names)),)
+            )
+            return {name: float(rate) for name, rate in cur.fetchall()}
+
+
+def get_rate(currency_name):
+    return get_rates([currency_name]).get(currency_name)
+
+
+# Поиск валюты без учёта регистра; возвращает (название, курс) или None
+def find_currency(currency_name):
+    if rate_cache is not None:
+        snapshot = rate_cache.snapshot()
+        name = snapshot.names.get(currency_name.lower())
+        return (name, snapshot.rates[name]) if name is not None else None
+
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            # Использует индекс по lower(currency_name)
+            cur.execute(
+                "SELECT currency_name, rate FROM currencies "
+                "WHERE lower(currency_name) = lower(%s) LIMIT 1",
+                (currency_name,)
+            )
+            result = cur.fetchone()
+    return (result[0], float(result[1])) if result else None
 
 
 @app.route('/convert', methods=['GET'])
@@ -34,48 +161,159 @@ def convert_currency():
         return jsonify({'error': 'Amount должен быть числом'}), 400
 
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                # Получаем курс валюты
-                cur.execute(
-                    "SELECT rate FROM currencies WHERE currency_name = %s",
-                    (currency_name,)
-                )
-                result = cur.fetchone()
+        # Получаем курс валюты
+        rate = get_rate(currency_name)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    if rate is None:
+        return jsonify({'error': 'Валюта не найдена'}), 404
 
-                if not result:
-                    return jsonify({'error': 'Валюта не найдена'}), 404
+    converted_amount = round(amount * rate, 2)
 
-                rate = float(result[0])
-                converted_amount = round(amount * rate, 2)
+    return jsonify({
+        'original_amount': amount,
+        'currency': currency_name,
+        'rate': rate,
+        'converted_amount': converted_amount
+    }), 200
 
-                return jsonify({
-                    'original_amount': amount,
-                    'currency': currency_name,
-                    'rate': rate,
-                    'converted_amount': converted_amount
-                }), 200
+
+@app.route('/convert/batch', methods=['POST'])
+def convert_batch():
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else None
+
+    if not isinstance(items, list):
+        return jsonify({'error': 'Необходимо указать items - список пар currency и amount'}), 400
+
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Не более {MAX_BATCH_SIZE} пар в одном запросе'}), 413
+
+    try:
+        # Один поиск курсов на весь пакет
+        rates = get_rates(batch_currency_names(items))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    return jsonify(convert_items(items, rates)), 200
+
+
+# Постраничная выдача по ключу: каждая страница - один проход по индексу
+# currency_name, начиная сразу после последнего названия прошлой страницы
+def get_currencies_page(after, limit):
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT currency_name, rate FROM currencies "
+                "WHERE %(after)s IS NULL OR currency_name > %(after)s "
+                "ORDER BY currency_name LIMIT %(limit)s",
+                {'after': after, 'limit': limit + 1}
+            )
+            rows = cur.fetchall()
+
+    result = [{
+        'currency_name': currency[0],
+        'rate': float(currency[1])
+    } for currency in rows[:limit]]
+    next_after = result[-1]['currency_name'] if len(rows) > limit else None
+
+    return jsonify({'currencies': result, 'next_after': next_after}), 200
+
+
+# NDJSON из именованного (серверного) курсора: строки приходят из БД
+# пачками по STREAM_FETCH_SIZE, поэтому память не зависит от размера таблицы
+def stream_currencies(after):
+    def generate():
+        with pool.connection() as conn:
+            with conn.cursor(name='currencies_stream') as cur:
+                cur.itersize = STREAM_FETCH_SIZE
+                cur.execute(
+                    "SELECT currency_name, rate FROM currencies "
+                    "WHERE %(after)s IS NULL OR currency_name > %(after)s "
+                    "ORDER BY currency_name",
+                    {'after': after}
+                )
+                for currency_name, rate in cur:
+                    yield json.dumps({
+                        'currency_name': currency_name,
+                        'rate': float(rate)
+                    }) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
 
 @app.route('/currencies', methods=['GET'])
 def get_all_currencies():
+    after = request.args.get('after')
+    limit = request.args.get('limit')
+
+    if (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson'):
+        return stream_currencies(after)
+
+    if after is not None or limit is not None:
+        try:
+            limit = int(limit) if limit is not None else DEFAULT_PAGE_SIZE
+        except ValueError:
+            return jsonify({'error': 'limit должен быть целым числом'}), 400
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({'error': f'limit должен быть от 1 до {MAX_PAGE_SIZE}'}), 400
+
+        try:
+            return get_currencies_page(after, limit)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    if rate_cache is None:
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT currency_name, rate FROM currencies")
+                    currencies = cur.fetchall()
+
+                    result = [{
+                        'currency_name': currency[0],
+                        'rate': float(currency[1])
+                    } for currency in currencies]
+
+                    return jsonify({'currencies': result}), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT currency_name, rate FROM currencies")
-                currencies = cur.fetchall()
+        snapshot = rate_cache.snapshot()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    # Тело собрано при загрузке снимка; на If-None-Match и If-Modified-Since
+    # make_conditional отвечает 304 без обращения к БД
+    response = app.response_class(snapshot.body, mimetype='application/json')
+    response.set_etag(f'v{snapshot.version}')
+    response.last_modified = snapshot.last_modified
+    response.headers['X-Catalog-Version'] = str(snapshot.version)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
-                result = [{
-                    'currency_name': currency[0],
-                    'rate': float(currency[1])
-                } for currency in currencies]
 
-                return jsonify({'currencies': result}), 200
+# GET и HEAD: HEAD отдаёт только статус, чтобы проверить существование валюты
+@app.route('/currencies/<path:currency_name>', methods=['GET'])
+def get_currency(currency_name):
+    try:
+        result = find_currency(currency_name)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    if result is None:
+        return jsonify({'error': 'Валюта не найдена'}), 404
+
+    return jsonify({'currency_name': result[0], 'rate': result[1]}), 200
+
+
+@app.route('/pool_stats', methods=['GET'])
+def get_pool_stats():
+    return jsonify(pool.stats()), 200
+
 
 if __name__ == '__main__':
     app.run(port=5002, debug=True)
\ No newline at end of file
@@ -0,0 +1,300 @@
+# ASGI-версия data_manager.py на Quart и asyncpg с теми же маршрутами
+# и JSON-ответами. Запуск в несколько процессов:
+#   uvicorn data_manager_async:app --port 5002 --workers 4
+import asyncio
+import json
+import os
+import time
+
+from quart import Quart, Response, request, jsonify
+
+from db import CHANGES_CHANNEL
+from db_async import acquire, create_pool, ensure_schema, listen, pool_stats
+from payloads import batch_currency_names, build_snapshot, convert_items
+
+app = Quart(__name__)
+
+ASGI_WORKERS = int(os.getenv('ASGI_WORKERS', '4'))
+
+# Те же настройки, что и у data_manager.py
+RATE_CACHE_TTL = float(os.getenv('RATE_CACHE_TTL', '300'))
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '10000'))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '1000'))
+STREAM_FETCH_SIZE = 1000
+
+
+# Асинхронный аналог RateCache из data_manager.py
+class RateCache:
+    def __init__(self, pool, ttl):
+        self._pool = pool
+        self.ttl = ttl
+        self._reload_lock = asyncio.Lock()
+        self._snapshot = None
+        self._loaded_at = None
+        self._generation = 0
+
+    def _is_fresh(self):
+        return (self._loaded_at is not None
+                and time.monotonic() - self._loaded_at < self.ttl)
+
+    async def load(self, force=True):
+        async with self._reload_lock:
+            if not force and self._is_fresh():
+                return self._snapshot
+            generation = self._generation
+
+            async with acquire(self._pool) as conn:
+                # Версия и курсы читаются из одного снимка БД
+                async with conn.transaction(isolation='repeatable_read', readonly=True):
+                    version, last_modified = await conn.fetchrow(
+                        "SELECT version, updated_at FROM catalog_version"
+                    )
+                    rows = await conn.fetch(
+                        "SELECT currency_name, rate FROM currencies ORDER BY currency_name"
+                    )
+
+            rates = {row['currency_name']: float(row['rate']) for row in rows}
+            self._snapshot = build_snapshot(version, last_modified, rates)
+            if generation == self._generation:
+                self._loaded_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self):
+        self._generation += 1
+        self._loaded_at = None
+
+    async def refresh(self, payload=None):
+        current = self._snapshot
+        if payload and current is not None and int(payload) <= current.version:
+            return
+
+        self.invalidate()
+        try:
+            await self.load()
+        except Exception:
+            pass
+
+    async def snapshot(self):
+        if self._is_fresh():
+            return self._snapshot
+        return await self.load(force=False)
+
+
+# Пул, кэш и слушатель уведомлений создаются в каждом рабочем процессе
+pool = None
+rate_cache = None
+listener = None
+
+
+@app.before_serving
+async def startup():
+    global pool, rate_cache, listener
+    pool = await create_pool()
+    await ensure_schema(pool)
+    if RATE_CACHE_TTL > 0:
+        rate_cache = RateCache(pool, RATE_CACHE_TTL)
+        await rate_cache.load()
+        listener = asyncio.ensure_future(listen(CHANGES_CHANNEL, rate_cache.refresh))
+
+
+@app.after_serving
+async def shutdown():
+    if listener is not None:
+        listener.cancel()
+    await pool.close()
+
+
+async def get_rates(currency_names):
+    if rate_cache is not None:
+        rates = (await rate_cache.snapshot()).rates
+        return {name: rates[name] for name in currency_names if name in rates}
+
+    async with acquire(pool) as conn:
+        rows = await conn.fetch(
+            "SELECT currency_name, rate FROM currencies WHERE currency_name = ANY($1::text[])",
+            list(set(currency_names))
+        )
+    return {row['currency_name']: float(row['rate']) for row in rows}
+
+
+async def find_currency(currency_name):
+    if rate_cache is not None:
+        snapshot = await rate_cache.snapshot()
+        name = snapshot.names.get(currency_name.lower())
+        return (name, snapshot.rates[name]) if name is not None else None
+
+    async with acquire(pool) as conn:
+        row = await conn.fetchrow(
+            "SELECT currency_name, rate FROM currencies "
+            "WHERE lower(currency_name) = lower($1) LIMIT 1",
+            currency_name
+        )
+    return (row['currency_name'], float(row['rate'])) if row else None
+
+
+@app.route('/convert', methods=['GET'])
+async def convert_currency():
+    currency_name = request.args.get('currency')
+    amount = request.args.get('amount')
+
+    if not currency_name or not amount:
+        return jsonify({'error': 'Необходимо указать currency и amount'}), 400
+
+    try:
+        amount = float(amount)
+    except ValueError:
+        return jsonify({'error': 'Amount должен быть числом'}), 400
+
+    try:
+        rate = (await get_rates([currency_name])).get(currency_name)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    if rate is None:
+        return jsonify({'error': 'Валюта не найдена'}), 404
+
+    return jsonify({
+        'original_amount': amount,
+        'currency': currency_name,
+        'rate': rate,
+        'converted_amount': round(amount * rate, 2)
+    }), 200
+
+
+@app.route('/convert/batch', methods=['POST'])
+async def convert_batch():
+    data = await request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else None
+
+    if not isinstance(items, list):
+        return jsonify({'error': 'Необходимо указать items - список пар currency и amount'}), 400
+
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Не более {MAX_BATCH_SIZE} пар в одном запросе'}), 413
+
+    try:
+        rates = await get_rates(batch_currency_names(items))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify(convert_items(items, rates)), 200
+
+
+# Для первой страницы и для продолжения - отдельные тексты запросов:
+# подготовленный запрос с условием "$1 IS NULL OR ..." не всегда идёт по индексу
+async def get_currencies_page(after, limit):
+    async with acquire(pool) as conn:
+        if after is None:
+            rows = await conn.fetch(
+                "SELECT currency_name, rate FROM currencies "
+                "ORDER BY currency_name LIMIT $1",
+                limit + 1
+            )
+        else:
+            rows = await conn.fetch(
+                "SELECT currency_name, rate FROM currencies WHERE currency_name > $1 "
+                "ORDER BY currency_name LIMIT $2",
+                after, limit + 1
+            )
+
+    result = [{
+        'currency_name': row['currency_name'],
+        'rate': float(row['rate'])
+    } for row in rows[:limit]]
+    next_after = result[-1]['currency_name'] if len(rows) > limit else None
+
+    return jsonify({'currencies': result, 'next_after': next_after}), 200
+
+
+def stream_currencies(after):
+    async def generate():
+        if after is None:
+            query, args = "SELECT currency_name, rate FROM currencies ORDER BY currency_name", []
+        else:
+            query, args = (
+                "SELECT currency_name, rate FROM currencies WHERE currency_name > $1 "
+                "ORDER BY currency_name",
+                [after]
+            )
+
+        async with acquire(pool) as conn:
+            async with conn.transaction(readonly=True):
+                async for row in conn.cursor(query, *args, prefetch=STREAM_FETCH_SIZE):
+                    yield json.dumps({
+                        'currency_name': row['currency_name'],
+                        'rate': float(row['rate'])
+                    }) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/currencies', methods=['GET'])
+async def get_all_currencies():
+    after = request.args.get('after')
+    limit = request.args.get('limit')
+
+    if (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson'):
+        return stream_currencies(after)
+
+    if after is not None or limit is not None:
+        try:
+            limit = int(limit) if limit is not None else DEFAULT_PAGE_SIZE
+        except ValueError:
+            return jsonify({'error': 'limit должен быть целым числом'}), 400
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({'error': f'limit должен быть от 1 до {MAX_PAGE_SIZE}'}), 400
+
+        try:
+            return await get_currencies_page(after, limit)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    if rate_cache is None:
+        try:
+            async with acquire(pool) as conn:
+                rows = await conn.fetch("SELECT currency_name, rate FROM currencies")
+            result = [{
+                'currency_name': row['currency_name'],
+                'rate': float(row['rate'])
+            } for row in rows]
+            return jsonify({'currencies': result}), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    try:
+        snapshot = await rate_cache.snapshot()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    response = Response(snapshot.body, mimetype='application/json')
+    response.set_etag(f'v{snapshot.version}')
+    response.last_modified = snapshot.last_modified
+    response.headers['X-Catalog-Version'] = str(snapshot.version)
+    response.cache_control.no_cache = True
+    return await response.make_conditional(request)
+
+
+@app.route('/currencies/<path:currency_name>', methods=['GET'])
+async def get_currency(currency_name):
+    try:
+        result = await find_currency(currency_name)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    if result is None:
+        return jsonify({'error': 'Валюта не найдена'}), 404
+
+    return jsonify({'currency_name': result[0], 'rate': result[1]}), 200
+
+
+@app.route('/pool_stats', methods=['GET'])
+async def get_pool_stats():
+    return jsonify(pool_stats(pool)), 200
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run('data_manager_async:app', port=5002, workers=ASGI_WORKERS)
@@ -0,0 +1,267 @@
+import os
+import select
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, sql
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Конфигурация подключения к БД через переменные окружения
+DB_CONFIG = {
+    'host': os.environ['DB_HOST'],
+    'port': os.environ['DB_PORT'],
+    'user': os.environ['DB_USER'],
+    'password': os.environ['DB_PASSWORD'],
+    'database': os.environ['DB_NAME']
+}
+
+# Настройки пула соединений
+POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+# Сколько секунд запрос ждёт свободное соединение
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+# Соединение, простоявшее дольше этого времени, проверяется SELECT 1
+POOL_CHECK_IDLE = float(os.getenv('DB_POOL_CHECK_IDLE', '30'))
+
+# Канал LISTEN/NOTIFY, в который currency_manager сообщает об изменении валют
+CHANGES_CHANNEL = 'currencies_changed'
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Потокобезопасный пул соединений psycopg2: держит не более maxconn
+# открытых соединений, при выдаче проверяет их живость, а при исчерпании
+# пула ждёт свободное соединение не дольше timeout секунд
+class ConnectionPool:
+    def __init__(self, config, minconn=POOL_MIN, maxconn=POOL_MAX,
+                 timeout=POOL_TIMEOUT, check_idle=POOL_CHECK_IDLE):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError('Неверные размеры пула: min=%s, max=%s' % (minconn, maxconn))
+
+        self._config = config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+
+        self._cond = threading.Condition()
+        self._idle = []  # пары (соединение, время возврата в пул)
+        self._in_use = 0
+        self._counters = {
+            'checkouts': 0,
+            'connects': 0,
+            'discarded': 0,
+            'timeouts': 0,
+            'wait_seconds': 0.0,
+        }
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._config)
+        with self._cond:
+            self._counters['connects'] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._cond:
+            self._counters['discarded'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        with self._cond:
+            while not self._idle and self._in_use >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        'Нет свободных соединений с БД за %.1f с' % self.timeout
+                    )
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            item = self._idle.pop() if self._idle else None
+            self._counters['checkouts'] += 1
+            self._counters['wait_seconds'] += time.monotonic() - started
+
+        try:
+            if item is not None:
+                conn, idle_since = item
+                if self._is_healthy(conn, idle_since):
+                    return conn
+                self._discard(conn)
+            return self._connect()
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, close=False):
+        if not close and not conn.closed:
+            # Незавершённую транзакцию откатываем, сломанное соединение закрываем
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+
+        with self._cond:
+            self._in_use -= 1
+            keep = not close and not conn.closed and len(self._idle) < self.maxconn
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+        if not keep:
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._cond:
+            result = dict(self._counters)
+            result.update({
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'size': self._in_use + len(self._idle),
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            })
+        result['wait_seconds'] = round(result['wait_seconds'], 6)
+        return result
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+def create_pool():
+    return ConnectionPool(DB_CONFIG)
+
+
+# Таблицы и индексы, на которые опираются запросы сервисов
+SCHEMA = [
+    # Нужен для INSERT ... ON CONFLICT (currency_name) в /load
+    "CREATE UNIQUE INDEX IF NOT EXISTS currencies_currency_name_key "
+    "ON currencies (currency_name)",
+    # Поиск валюты без учёта регистра в GET /currencies/<name>
+    "CREATE INDEX IF NOT EXISTS currencies_currency_name_lower_idx "
+    "ON currencies (lower(currency_name))",
+    # Версия каталога валют: растёт при каждом изменении таблицы currencies
+    "CREATE TABLE IF NOT EXISTS catalog_version ("
+    " id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),"
+    " version BIGINT NOT NULL DEFAULT 1,"
+    " updated_at TIMESTAMPTZ NOT NULL DEFAULT now())",
+    "INSERT INTO catalog_version DEFAULT VALUES ON CONFLICT (id) DO NOTHING",
+]
+
+
+# Схему создают все процессы сервисов при старте: под блокировкой по очереди,
+# иначе одновременные CREATE ... IF NOT EXISTS падают на уникальности
+# системных каталогов. Блокировка снимается вместе с транзакцией
+SCHEMA_LOCK = "SELECT pg_advisory_xact_lock(hashtext('lab6_schema'))"
+
+
+def ensure_schema(pool):
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SCHEMA_LOCK)
+            for statement in SCHEMA:
+                cur.execute(statement)
+        conn.commit()
+
+
+# Увеличивает версию каталога и сообщает её слушателям. Уведомление
+# доставляется только после COMMIT транзакции, в которой оно отправлено,
+# а при откате не доставляется вовсе
+def notify_currencies_changed(cur):
+    cur.execute(
+        "UPDATE catalog_version SET version = version + 1, updated_at = now() "
+        "RETURNING version"
+    )
+    version = cur.fetchone()[0]
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANGES_CHANNEL, str(version)))
+    return version
+
+
+# Фоновый поток, который держит отдельное соединение с LISTEN на канал
+# и вызывает callback(payload) на каждое уведомление. После переподключения
+# callback вызывается с payload=None: уведомления за время обрыва потеряны
+class ChangeListener(threading.Thread):
+    def __init__(self, config, channel, callback, reconnect_delay=5.0):
+        super().__init__(name='listen-%s' % channel, daemon=True)
+        self._config = config
+        self._channel = channel
+        self._callback = callback
+        self._reconnect_delay = reconnect_delay
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _listen(self, conn):
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL('LISTEN {}').format(sql.Identifier(self._channel)))
+
+        while not self._stop_event.is_set():
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self._callback(notify.payload)
+
+    def run(self):
+        reconnected = False
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self._config)
+                if reconnected:
+                    self._callback(None)
+                self._listen(conn)
+            except psycopg2.Error:
+                reconnected = True
+                self._stop_event.wait(self._reconnect_delay)
+            finally:
+                if conn is not None:
+                    conn.close()
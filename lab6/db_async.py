@@ -0,0 +1,88 @@
+# Асинхронный доступ к БД для ASGI-версий сервисов: пул asyncpg с теми же
+# настройками, что и у ConnectionPool из db.py
+import asyncio
+
+import asyncpg
+
+from db import CHANGES_CHANNEL, DB_CONFIG, POOL_MAX, POOL_MIN, POOL_TIMEOUT, SCHEMA, SCHEMA_LOCK
+
+ASYNC_DB_CONFIG = dict(DB_CONFIG, port=int(DB_CONFIG['port']))
+
+
+async def create_pool():
+    return await asyncpg.create_pool(
+        min_size=POOL_MIN,
+        max_size=POOL_MAX,
+        **ASYNC_DB_CONFIG
+    )
+
+
+# Соединение из пула с тем же ограничением ожидания, что и в db.ConnectionPool
+def acquire(pool):
+    return pool.acquire(timeout=POOL_TIMEOUT)
+
+
+def pool_stats(pool):
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    return {
+        'min_size': pool.get_min_size(),
+        'max_size': pool.get_max_size(),
+        'size': size,
+        'in_use': size - idle,
+        'idle': idle,
+    }
+
+
+async def ensure_schema(pool):
+    async with acquire(pool) as conn:
+        async with conn.transaction():
+            await conn.execute(SCHEMA_LOCK)
+            for statement in SCHEMA:
+                await conn.execute(statement)
+
+
+# Асинхронный аналог db.notify_currencies_changed; вызывается внутри транзакции
+async def notify_currencies_changed(conn):
+    version = await conn.fetchval(
+        "UPDATE catalog_version SET version = version + 1, updated_at = now() "
+        "RETURNING version"
+    )
+    await conn.execute("SELECT pg_notify($1, $2)", CHANGES_CHANNEL, str(version))
+    return version
+
+
+# Слушает канал на отдельном соединении и вызывает корутину callback(payload)
+# на каждое уведомление; после переподключения - с payload=None, как
+# db.ChangeListener. Работает, пока задачу не отменят
+async def listen(channel, callback, reconnect_delay=5.0):
+    tasks = set()
+
+    def on_notify(conn, pid, channel, payload):
+        task = asyncio.ensure_future(callback(payload))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    reconnected = False
+    while True:
+        try:
+            conn = await asyncpg.connect(**ASYNC_DB_CONFIG)
+        except (OSError, asyncpg.PostgresError):
+            reconnected = True
+            await asyncio.sleep(reconnect_delay)
+            continue
+
+        closed = asyncio.Event()
+        conn.add_termination_listener(lambda conn: closed.set())
+        try:
+            await conn.add_listener(channel, on_notify)
+            if reconnected:
+                await callback(None)
+            await closed.wait()
+        except (OSError, asyncpg.PostgresError):
+            pass
+        finally:
+            await conn.close()
+
+        reconnected = True
+        await asyncio.sleep(reconnect_delay)
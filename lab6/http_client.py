@@ -0,0 +1,79 @@
+import asyncio
+from collections import namedtuple
+
+import aiohttp
+
+from common.metrics import timed
+
+# Ответ сервиса: HTTP-статус и разобранное JSON-тело (None, если тела нет)
+ServiceResponse = namedtuple('ServiceResponse', ['status', 'data'])
+
+# Статусы, при которых идемпотентный запрос имеет смысл повторить
+RETRY_STATUSES = {502, 503, 504}
+
+
+class ServiceError(Exception):
+    pass
+
+
+# Асинхронный HTTP-клиент для сервисов lab6. Одна сессия aiohttp на весь бот:
+# соединения переиспользуются (keep-alive), число одновременных соединений
+# ограничено, у каждого запроса есть таймаут и повторы с паузой
+class HttpClient:
+    def __init__(self, timeout=5.0, retries=2, backoff=0.2, limit=100):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.limit = limit
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=30)
+            )
+        return self._session
+
+    async def request(self, method, url, *, params=None, json=None, headers=None, timeout=None):
+        # POST повторяем, только если соединение не удалось установить:
+        # иначе запрос мог уже выполниться на сервере
+        idempotent = method in ('GET', 'HEAD')
+        attempt = 0
+        while True:
+            try:
+                with timed('http', method):
+                    async with self._get_session().request(
+                        method,
+                        url,
+                        params=params,
+                        json=json,
+                        headers=headers,
+                        # Без своего таймаута у запроса действует таймаут сессии
+                        **({'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout else {})
+                    ) as response:
+                        if idempotent and response.status in RETRY_STATUSES and attempt < self.retries:
+                            raise aiohttp.ServerConnectionError(f'HTTP {response.status}')
+                        data = None
+                        if method != 'HEAD' and response.content_type == 'application/json':
+                            data = await response.json()
+                        return ServiceResponse(response.status, data)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = idempotent or isinstance(e, aiohttp.ClientConnectorError)
+                if not retryable or attempt >= self.retries:
+                    raise ServiceError(f'{method} {url}: {e!r}') from e
+            attempt += 1
+            await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def head(self, url, **kwargs):
+        return await self.request('HEAD', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
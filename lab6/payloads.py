@@ -0,0 +1,121 @@
+# Разбор тел запросов и сборка ответов, общие для Flask- и ASGI-версий сервисов
+import json
+import math
+from collections import namedtuple
+
+
+# Курс - число или строка с числом; true/false, NaN и бесконечность не курс
+def is_rate(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return False
+    try:
+        return math.isfinite(float(value))
+    except ValueError:
+        return False
+
+
+# Достаёт из тела запроса список пар (currency_name, курс числом).
+# Поддерживается как одна валюта {"currency_name": ..., rate_field: ...}, так
+# и пакет {"currencies": [...]} из таких же объектов. Возвращает (пары, пакет
+# ли, текст ошибки); в ошибке пакета перечислены все неверные элементы.
+# Повторы названия в пакете схлопываются, побеждает последний
+def parse_currencies(data, rate_field):
+    if not isinstance(data, dict):
+        return None, False, 'Ожидается JSON-объект'
+
+    is_batch = 'currencies' in data
+    items = data.get('currencies') if is_batch else [data]
+    if not isinstance(items, list) or not items:
+        return None, is_batch, 'currencies должен быть непустым списком'
+
+    pairs = {}
+    invalid = []
+    for index, item in enumerate(items):
+        currency_name = item.get('currency_name') if isinstance(item, dict) else None
+        rate = item.get(rate_field) if isinstance(item, dict) else None
+        if not isinstance(currency_name, str) or not currency_name or not rate:
+            invalid.append((index, currency_name, f'Необходимо указать currency_name и {rate_field}'))
+        elif not is_rate(rate):
+            invalid.append((index, currency_name, f'{rate_field} должен быть числом'))
+        else:
+            pairs.pop(currency_name, None)
+            pairs[currency_name] = float(rate)
+
+    if invalid and not is_batch:
+        return None, False, invalid[0][2]
+    if invalid:
+        return None, True, 'Неверные элементы: ' + '; '.join(
+            f'{index} ({currency_name}): {error}' if isinstance(currency_name, str)
+            else f'{index}: {error}'
+            for index, currency_name, error in invalid
+        )
+
+    return list(pairs.items()), is_batch, None
+
+
+# Названия валют из пакета /convert/batch, для которых нужен курс
+def batch_currency_names(items):
+    return {
+        item['currency'] for item in items
+        if isinstance(item, dict) and isinstance(item.get('currency'), str)
+    }
+
+
+# Конвертирует пакет пар по готовой таблице курсов; ошибка в одной паре
+# попадает в её результат и не мешает остальным
+def convert_items(items, rates):
+    results = []
+    failed = 0
+    for item in items:
+        currency_name = item.get('currency') if isinstance(item, dict) else None
+        amount = item.get('amount') if isinstance(item, dict) else None
+
+        if not isinstance(currency_name, str) or not currency_name or amount is None:
+            error = 'Необходимо указать currency и amount'
+        else:
+            try:
+                amount = float(amount)
+                error = None
+            except (TypeError, ValueError):
+                error = 'Amount должен быть числом'
+
+        if error is None and currency_name not in rates:
+            error = 'Валюта не найдена'
+
+        if error is not None:
+            failed += 1
+            results.append({'currency': currency_name, 'error': error})
+            continue
+
+        rate = rates[currency_name]
+        results.append({
+            'original_amount': amount,
+            'currency': currency_name,
+            'rate': rate,
+            'converted_amount': round(amount * rate, 2)
+        })
+
+    return {
+        'results': results,
+        'converted': len(results) - failed,
+        'failed': failed
+    }
+
+
+# Снимок каталога валют: версия из catalog_version, время её изменения,
+# курсы, названия по ключу в нижнем регистре и заранее сериализованное
+# тело ответа GET /currencies
+CatalogSnapshot = namedtuple(
+    'CatalogSnapshot', ['version', 'last_modified', 'rates', 'names', 'body']
+)
+
+
+def build_snapshot(version, last_modified, rates):
+    body = json.dumps({
+        'currencies': [
+            {'currency_name': name, 'rate': rate} for name, rate in rates.items()
+        ],
+        'version': version
+    }).encode()
+    names = {name.lower(): name for name in rates}
+    return CatalogSnapshot(version, last_modified, rates, names, body)
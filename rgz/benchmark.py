@@ -0,0 +1,42 @@
+import argparse
+import asyncio
+
+import aiohttp
+
+from common.benchmark import bench_http, report
+
+
+# Первый ответ даёт ETag, с которым кэширующий клиент перепроверяет ресурс
+async def fetch_etag(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return response.headers['ETag']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный замер сервиса курсов cs.py")
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("-n", "--requests", type=int, default=5000)
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    cases = [
+        ("/rate?currency=USD", "/rate?currency=USD", False),
+        ("/rates", "/rates", False),
+        ("/rates?currency=USD,EUR", "/rates?currency=USD,EUR", False),
+        ("/rates (If-None-Match)", "/rates", True),
+    ]
+    for title, path, revalidate in cases:
+        url = args.base_url + path
+        # С If-None-Match сервис отвечает 304 без тела
+        headers = {'If-None-Match': asyncio.run(fetch_etag(url))} if revalidate else None
+        timings, elapsed, errors = asyncio.run(
+            bench_http(url, args.requests, args.concurrency, headers)
+        )
+        report(title, timings, elapsed)
+        if errors:
+            print(f"Ошибочных ответов: {errors}")
+
+
+if __name__ == "__main__":
+    main()
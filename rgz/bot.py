@@ -1,20 +1,45 @@
 import asyncio
 import os
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram import Dispatcher, types, F
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from aiogram.types import ReplyKeyboardRemove
 from dotenv import load_dotenv
 import psycopg2
-import requests
+import time
+from collections import OrderedDict
 from datetime import datetime
 
+from common.fsm_storage import create_storage
+from common.metrics import db_cursor_factory, setup_metrics, timed
+from common.outbox import Outbox
+from common.webhook import create_bot, run_bot
+from rgz import totals
+from rgz.rate_client import RateClient
+
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+bot = create_bot(BOT_TOKEN)
+dp = Dispatcher(storage=create_storage())
+setup_metrics(dp, bot)
+# Длинные ответы уходят через очередь common.outbox с учётом лимитов Telegram
+outbox = Outbox(bot)
+dp.startup.register(outbox.start)
+dp.shutdown.register(outbox.close)
+
+# Курсы валют из сервиса cs.py: кэш на RATE_TTL секунд, ещё RATE_STALE_TTL
+# секунд прежний курс отдаётся сразу и обновляется в фоне
+rate_client = RateClient(
+    os.getenv("RATE_SERVICE_URL", "http://localhost:5000"),
+    ttl=float(os.getenv("RATE_TTL", "60")),
+    stale_ttl=float(os.getenv("RATE_STALE_TTL", "600")),
+    timeout=float(os.getenv("RATE_TIMEOUT", "3"))
+)
+dp.shutdown.register(rate_client.close)
 
 DB_CONFIG = {
     'host': os.environ['DB_HOST'],
@@ -24,8 +49,46 @@ DB_CONFIG = {
     'database': os.environ['DB_NAME']
 }
 
+DB_CURSOR_FACTORY = db_cursor_factory()
+
 def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
+    with timed('db', 'connect'):
+        return psycopg2.connect(cursor_factory=DB_CURSOR_FACTORY, **DB_CONFIG)
+
+# Индексы, на которые опираются запросы бота
+SCHEMA = [
+    # Страница истории операций - один проход по диапазону индекса
+    "CREATE INDEX IF NOT EXISTS operations_chat_id_date_id_idx "
+    "ON operations (chat_id, date DESC, id DESC)",
+]
+
+def create_schema():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        # Процессы-обработчики стартуют одновременно: схема меняется по очереди
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('rgz_init'))")
+        for statement in SCHEMA:
+            cur.execute(statement)
+        totals.create_totals_table(cur)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+dp.startup.register(create_schema)
+
+# Сколько операций показывается на одной странице
+OPERATIONS_PAGE_SIZE = int(os.getenv("OPERATIONS_PAGE_SIZE", "20"))
+
+# Кнопка перехода по истории: валюта и операция (date, id), от которой
+# читается следующая страница; direction "older" - более ранние операции,
+# "newer" - более поздние
+class OperationsPage(CallbackData, prefix="ops"):
+    currency: str
+    direction: str
+    date: str
+    id: int
 
 # Состояния FSM
 class RegStates(StatesGroup):
@@ -39,15 +102,74 @@ class OperationStates(StatesGroup):
 class ViewOperationsStates(StatesGroup):
     waiting_for_currency = State()
 
+# Сколько секунд помнить, что чат не зарегистрирован
+UNREGISTERED_TTL = float(os.getenv("UNREGISTERED_TTL", "60"))
+
+# Зарегистрированные чаты в памяти: список загружается при старте и
+# меняется в /reg и /delaccount. Все обновления чата обрабатывает один
+# процесс (common/runner.py), поэтому его набор не расходится с таблицей.
+# Чат, которого нет в наборе, проверяется в БД (вдруг его добавили в обход
+# бота), а отрицательный ответ запоминается на negative_ttl секунд
+class RegisteredUsers:
+    def __init__(self, negative_ttl):
+        self.negative_ttl = negative_ttl
+        self.chat_ids = set()
+        # chat_id -> до какого времени считать незарегистрированным; срок у
+        # всех записей одинаковый, поэтому порядок вставки - порядок истечения
+        self._unknown = OrderedDict()
+
+    def load(self):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT id FROM users")
+            self.chat_ids = {row[0] for row in cur.fetchall()}
+        finally:
+            cur.close()
+            conn.close()
+        self._unknown.clear()
+
+    def __contains__(self, chat_id):
+        if chat_id in self.chat_ids:
+            return True
+        expires_at = self._unknown.get(chat_id)
+        if expires_at is not None and expires_at > time.monotonic():
+            return False
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT 1 FROM users WHERE id = %s", (chat_id,))
+            registered = cur.fetchone() is not None
+        finally:
+            cur.close()
+            conn.close()
+
+        if registered:
+            self.add(chat_id)
+        else:
+            self.discard(chat_id)
+        return registered
+
+    def add(self, chat_id):
+        self.chat_ids.add(chat_id)
+        self._unknown.pop(chat_id, None)
+
+    def discard(self, chat_id):
+        self.chat_ids.discard(chat_id)
+        now = time.monotonic()
+        self._unknown.pop(chat_id, None)
+        self._unknown[chat_id] = now + self.negative_ttl
+        # Истёкшие записи - в начале
+        while self._unknown and next(iter(self._unknown.values())) <= now:
+            self._unknown.popitem(last=False)
+
+registered_users = RegisteredUsers(UNREGISTERED_TTL)
+dp.startup.register(registered_users.load)
+
 # Проверка регистрации
 def is_registered(chat_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM users WHERE id = %s", (chat_id,))
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
-    return result is not None
+    return chat_id in registered_users
 
 # Команда /start с настройкой меню
 @dp.message(Command("start"))
@@ -58,6 +180,7 @@ async def cmd_start(message: types.Message):
         types.BotCommand(command="reg", description="Регистрация"),
         types.BotCommand(command="add_operation", description="Добавить операцию"),
         types.BotCommand(command="operations", description="Мои операции"),
+        types.BotCommand(command="summary", description="Доходы и расходы по месяцам"),
         types.BotCommand(command="delaccount", description="Удалить аккаунт")
     ])
     await message.answer(
@@ -66,6 +189,7 @@ async def cmd_start(message: types.Message):
         "/reg — регистрация\n"
         "/add_operation — новая операция\n"
         "/operations — просмотр операций\n"
+        "/summary — доходы и расходы по месяцам\n"
         "/delaccount — удалить аккаунт\n\n"
         "Используйте меню слева для быстрого доступа к командам.",
         reply_markup=ReplyKeyboardRemove()
@@ -92,8 +216,10 @@ async def process_name(message: types.Message, state: FSMContext):
             (message.chat.id, message.text)
         )
         conn.commit()
+        registered_users.add(message.chat.id)
         await message.answer("Регистрация успешна!")
     except psycopg2.IntegrityError:
+        registered_users.add(message.chat.id)
         await message.answer("Вы уже зарегистрированы!")
     finally:
         cur.close()
@@ -155,6 +281,7 @@ async def process_operation_date(message: types.Message, state: FSMContext):
             "INSERT INTO operations (date, sum, chat_id, type_operation) VALUES (%s, %s, %s, %s)",
             (date_value, data["sum"], message.chat.id, data["type_operation"])
         )
+        totals.add_operation(cur, message.chat.id, date_value, data["sum"], data["type_operation"])
         conn.commit()
         await message.answer("Операция успешно добавлена!")
     except Exception as e:
@@ -181,49 +308,220 @@ async def cmd_operations(message: types.Message, state: FSMContext):
     await message.answer("Выберите валюту для отображения операций:", reply_markup=keyboard)
     await state.set_state(ViewOperationsStates.waiting_for_currency)
 
+# Страница истории операций по ключу (date, id): без курсора - самые новые,
+# direction "older" - операции раньше курсора, "newer" - позже. Читается на
+# одну строку больше страницы, чтобы узнать, есть ли что-то дальше.
+# Возвращает (операции от новых к старым, есть ли новее, есть ли старше)
+def fetch_operations_page(chat_id, direction=None, cursor=None):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        if direction == "newer":
+            cur.execute(
+                "SELECT id, date, sum, type_operation FROM operations "
+                "WHERE chat_id = %s AND (date, id) > (%s, %s) "
+                "ORDER BY date, id LIMIT %s",
+                (chat_id, *cursor, OPERATIONS_PAGE_SIZE + 1)
+            )
+        elif direction == "older":
+            cur.execute(
+                "SELECT id, date, sum, type_operation FROM operations "
+                "WHERE chat_id = %s AND (date, id) < (%s, %s) "
+                "ORDER BY date DESC, id DESC LIMIT %s",
+                (chat_id, *cursor, OPERATIONS_PAGE_SIZE + 1)
+            )
+        else:
+            cur.execute(
+                "SELECT id, date, sum, type_operation FROM operations "
+                "WHERE chat_id = %s ORDER BY date DESC, id DESC LIMIT %s",
+                (chat_id, OPERATIONS_PAGE_SIZE + 1)
+            )
+        operations = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+    more = len(operations) > OPERATIONS_PAGE_SIZE
+    operations = operations[:OPERATIONS_PAGE_SIZE]
+    if direction == "newer":
+        operations.reverse()
+        return operations, more, True
+    return operations, direction == "older", more
+
+async def get_rate(currency):
+    if currency == "RUB":
+        return 1.0
+    return await rate_client.get_rate(currency)
+
+def operations_keyboard(currency, operations, has_newer, has_older):
+    buttons = []
+    if has_newer:
+        first = operations[0]
+        buttons.append(types.InlineKeyboardButton(
+            text="← Новее",
+            callback_data=OperationsPage(
+                currency=currency, direction="newer", date=first[1].isoformat(), id=first[0]
+            ).pack()
+        ))
+    if has_older:
+        last = operations[-1]
+        buttons.append(types.InlineKeyboardButton(
+            text="Старее →",
+            callback_data=OperationsPage(
+                currency=currency, direction="older", date=last[1].isoformat(), id=last[0]
+            ).pack()
+        ))
+    if not buttons:
+        return None
+    return types.InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+def format_operations(operations, currency, rate):
+    lines = ["Ваши операции:", ""]
+    for op in operations:
+        converted = float(op[2]) / rate
+        lines.append(f"{op[1].strftime('%Y-%m-%d')} | {converted:.2f} {currency} | {op[3]}")
+    return "\n".join(lines)
+
 @dp.message(ViewOperationsStates.waiting_for_currency)
 async def process_currency(message: types.Message, state: FSMContext):
     if message.text not in ["RUB", "USD", "EUR"]:
         await message.answer("Пожалуйста, выберите одну из предложенных валют.")
         return
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute(
-            "SELECT date, sum, type_operation FROM operations WHERE chat_id = %s ORDER BY date DESC",
-            (message.chat.id,)
-        )
-        operations = cur.fetchall()
+        operations, has_newer, has_older = fetch_operations_page(message.chat.id)
 
         if not operations:
             await message.answer("У вас пока нет операций.")
             return
 
-        response_text = "Ваши операции:\n\n"
-        
-        if message.text == "RUB":
-            for op in operations:
-                response_text += f"{op[0].strftime('%Y-%m-%d')} | {op[1]:.2f} RUB | {op[2]}\n"
-        else:
-            try:
-                response = requests.get(f"http://localhost:5000/rate?currency={message.text}")
-                rate = float(response.json()["rate"])
-                
-                for op in operations:
-                    converted = float(op[1]) / rate
-                    response_text += f"{op[0].strftime('%Y-%m-%d')} | {converted:.2f} {message.text} | {op[2]}\n"
-            except Exception as e:
-                await message.answer(f"Не удалось получить курс валюты. Ошибка: {e}")
-                return
-
-        await message.answer(response_text)
+        try:
+            rate = await get_rate(message.text)
+        except Exception as e:
+            await message.answer(f"Не удалось получить курс валюты. Ошибка: {e}")
+            return
+
+        await outbox.send(
+            message.chat.id,
+            format_operations(operations, message.text, rate),
+            reply_markup=operations_keyboard(message.text, operations, has_newer, has_older)
+        )
     except Exception as e:
         await message.answer(f"Произошла ошибка: {e}")
+    finally:
+        await state.clear()
+
+# Кнопки "Новее"/"Старее" под страницей операций
+@dp.callback_query(OperationsPage.filter())
+async def process_operations_page(callback: types.CallbackQuery, callback_data: OperationsPage):
+    # Слишком старое сообщение (InaccessibleMessage) бот не видит и изменить не может
+    if not isinstance(callback.message, types.Message):
+        await callback.answer(
+            "Сообщение устарело, запросите операции заново: /operations", show_alert=True
+        )
+        return
+
+    chat_id = callback.message.chat.id
+    try:
+        operations, has_newer, has_older = fetch_operations_page(
+            chat_id, callback_data.direction, (callback_data.date, callback_data.id)
+        )
+        if not operations:
+            await callback.answer("Больше операций нет.")
+            return
+        rate = await get_rate(callback_data.currency)
+    except Exception as e:
+        await callback.answer(f"Произошла ошибка: {e}", show_alert=True)
+        return
+
+    try:
+        await callback.message.edit_text(
+            format_operations(operations, callback_data.currency, rate),
+            reply_markup=operations_keyboard(callback_data.currency, operations, has_newer, has_older)
+        )
+    except TelegramBadRequest as e:
+        # Повторное нажатие старой кнопки: страница уже показана
+        if "message is not modified" not in e.message:
+            await callback.answer(f"Не удалось показать страницу: {e.message}", show_alert=True)
+            return
+    await callback.answer()
+
+SUMMARY_USAGE = (
+    "/summary — все месяцы\n"
+    "/summary 2024 — месяцы года\n"
+    "/summary 2024-03 — один месяц\n"
+    "/summary 2024-01 2024-06 — период"
+)
+
+# Первое и последнее число-месяц периода: "ГГГГ" - год, "ГГГГ-ММ" - месяц
+def parse_period_bound(text):
+    if len(text) == 4:
+        year = datetime.strptime(text, "%Y").date()
+        return year, year.replace(month=12)
+    month = datetime.strptime(text, "%Y-%m").date()
+    return month, month
+
+# Аргументы /summary в (первый месяц, последний месяц); None - без ограничения
+def parse_period(args):
+    parts = (args or "").split()
+    if not parts:
+        return None, None
+    if len(parts) > 2:
+        raise ValueError(args)
+    start, end = parse_period_bound(parts[0])
+    if len(parts) == 2:
+        end = parse_period_bound(parts[1])[1]
+    return start, end
+
+def format_summary(months):
+    lines = ["Доходы и расходы:", ""]
+    income_total = expense_total = 0
+    for month, by_type in months:
+        income = by_type.get("ДОХОД", 0)
+        expense = by_type.get("РАСХОД", 0)
+        income_total += income
+        expense_total += expense
+        lines.append(
+            f"{month.strftime('%Y-%m')} | доход {income:.2f} | расход {expense:.2f} "
+            f"| баланс {income - expense:.2f} RUB"
+        )
+    if len(months) > 1:
+        lines.append("")
+        lines.append(
+            f"Итого | доход {income_total:.2f} | расход {expense_total:.2f} "
+            f"| баланс {income_total - expense_total:.2f} RUB"
+        )
+    return "\n".join(lines)
+
+# Команда /summary: итоги по месяцам из operation_totals, по строке на месяц
+@dp.message(Command("summary"))
+async def cmd_summary(message: types.Message, command: CommandObject):
+    if not is_registered(message.chat.id):
+        await message.answer("Сначала зарегистрируйтесь с помощью /reg")
+        return
+
+    try:
+        start, end = parse_period(command.args)
+    except ValueError:
+        await message.answer(f"Не понял период. Примеры:\n{SUMMARY_USAGE}")
+        return
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        months = totals.fetch_summary(cur, message.chat.id, start, end)
+    except Exception as e:
+        await message.answer(f"Произошла ошибка: {e}")
+        return
     finally:
         cur.close()
         conn.close()
-        await state.clear()
+
+    if not months:
+        await message.answer("За этот период операций нет.")
+        return
+
+    await outbox.send(message.chat.id, format_summary(months))
 
 # Команда /delaccount
 @dp.message(Command("delaccount"))
@@ -237,8 +535,10 @@ async def cmd_delete_account(message: types.Message):
     
     try:
         cur.execute("DELETE FROM operations WHERE chat_id = %s", (message.chat.id,))
+        cur.execute("DELETE FROM operation_totals WHERE chat_id = %s", (message.chat.id,))
         cur.execute("DELETE FROM users WHERE id = %s", (message.chat.id,))
         conn.commit()
+        registered_users.discard(message.chat.id)
         await message.answer("Ваш аккаунт и все данные успешно удалены!")
     except Exception as e:
         conn.rollback()
@@ -248,7 +548,7 @@ async def cmd_delete_account(message: types.Message):
         conn.close()
 
 async def main():
-    await dp.start_polling(bot)
+    await run_bot(dp, bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,25 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from dotenv import load_dotenv
 from flask import Flask, request, jsonify
 
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
-rates = {
+# Курсы по умолчанию, если не задан ни файл, ни БД
+DEFAULT_RATES = {
     "USD": 79.5,
     "EUR": 90.2
 }
 
+# Откуда брать курсы: JSON-файл вида {"USD": 79.5, ...} или таблица
+# currencies (currency_name, rate) в Postgres по строке подключения
+RATES_FILE = os.getenv("RATES_FILE")
+RATES_DSN = os.getenv("RATES_DSN")
+# Как часто проверять источник на изменения, секунд
+RATES_RELOAD_INTERVAL = float(os.getenv("RATES_RELOAD_INTERVAL", "5"))
+# Сколько разных наборов валют /rates?currency=... держать готовыми
+# для одной версии таблицы
+MAX_CACHED_SELECTIONS = 1024
+
+# Таблица курсов одной версии: версия - хэш содержимого (одинаковая у всех
+# процессов и после перезапуска), курсы и тела ответов, собранные заранее.
+# Таблица не меняется: при перезагрузке её целиком заменяет новая
+RateTable = namedtuple("RateTable", ["version", "rates", "rate_bodies", "all_body", "selections"])
+
+
+def build_table(rates):
+    all_body = json.dumps({"rates": rates}, sort_keys=True).encode()
+    rate_bodies = {
+        currency: json.dumps({"rate": rate}).encode()
+        for currency, rate in rates.items()
+    }
+    version = hashlib.sha1(all_body).hexdigest()[:16]
+    return RateTable(version, rates, rate_bodies, all_body, {})
+
+
+def read_rates():
+    if RATES_FILE:
+        with open(RATES_FILE, encoding="utf-8") as f:
+            return {currency: float(rate) for currency, rate in json.load(f).items()}
+
+    if RATES_DSN:
+        import psycopg2
+
+        conn = psycopg2.connect(RATES_DSN)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT currency_name, rate FROM currencies")
+                return {currency: float(rate) for currency, rate in cur.fetchall()}
+        finally:
+            conn.close()
+
+    return dict(DEFAULT_RATES)
+
+
+# Признак того, что файл мог измениться; у БД такого нет - читаем каждый раз
+def source_stamp():
+    if RATES_FILE:
+        stat = os.stat(RATES_FILE)
+        return stat.st_mtime_ns, stat.st_size
+    return None
+
+
+table = build_table(read_rates())
+
+
+# Перечитывает источник раз в RATES_RELOAD_INTERVAL секунд и подменяет
+# таблицу, если курсы изменились. При ошибке остаётся прежняя таблица
+def reload_loop():
+    global table
+    stamp = source_stamp() if RATES_FILE else None
+    while True:
+        time.sleep(RATES_RELOAD_INTERVAL)
+        try:
+            new_stamp = source_stamp()
+            if RATES_FILE and new_stamp == stamp:
+                continue
+            new_table = build_table(read_rates())
+        except Exception as e:
+            # Признак не сдвигается: файл перечитается на следующем шаге,
+            # даже если его больше не меняли
+            logger.warning("Не удалось перечитать курсы: %r", e)
+            continue
+        stamp = new_stamp
+        if new_table.version != table.version:
+            table = new_table
+            logger.info("Курсы обновлены, версия %s", table.version)
+
+
+if RATES_FILE or RATES_DSN:
+    threading.Thread(target=reload_loop, name="rates-reload", daemon=True).start()
+
+
+# Готовое тело с ETag версии таблицы; на If-None-Match - 304 без тела
+def cached_response(current, body):
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(current.version)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 @app.route("/rate")
 def get_rate():
+    current = table
     currency = request.args.get("currency")
-    if not currency:
+    body = current.rate_bodies.get(currency)
+    if body is None:
         return jsonify({"message": "UNKNOWN CURRENCY"}), 400
 
-    if currency not in rates:
-        return jsonify({"message": "UNKNOWN CURRENCY"}), 400
+    return cached_response(current, body)
+
+
+# Все курсы или только перечисленные: /rates?currency=USD,EUR
+@app.route("/rates")
+def get_rates():
+    current = table
+    selection = tuple(sorted(set(filter(None, request.args.get("currency", "").split(",")))))
+    if not selection:
+        return cached_response(current, current.all_body)
+
+    body = current.selections.get(selection)
+    if body is None:
+        unknown = [name for name in selection if name not in current.rates]
+        if unknown:
+            return jsonify({"message": "UNKNOWN CURRENCY", "unknown": unknown}), 400
+
+        body = json.dumps({"rates": {name: current.rates[name] for name in selection}}).encode()
+        if len(current.selections) < MAX_CACHED_SELECTIONS:
+            current.selections[selection] = body
+
+    return cached_response(current, body)
 
-    try:
-        return jsonify({"rate": rates[currency]}), 200
-    except Exception:
-        return jsonify({"message": "UNEXPECTED ERROR"}), 500
 
 if __name__ == "__main__":
-    app.run(port=5000)
\ No newline at end of file
+    app.run(port=5000)
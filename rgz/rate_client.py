@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from common.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class RateError(Exception):
+    pass
+
+
+# Асинхронный клиент сервиса курсов cs.py. Одна сессия aiohttp с keep-alive
+# и таймаутом на запрос. Курсы кэшируются на ttl секунд для всех чатов сразу;
+# одновременные запросы одной валюты ждут один и тот же запрос к сервису.
+# Ещё stale_ttl секунд после истечения курс отдаётся сразу, а обновляется в
+# фоне; если сервис недоступен, в этом окне используется последний курс
+class RateClient:
+    def __init__(self, base_url, ttl=60, stale_ttl=600, timeout=3.0):
+        self.base_url = base_url.rstrip('/')
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # валюта -> (курс, время получения)
+        self._rates = {}
+        # валюта -> задача, которая сейчас запрашивает курс
+        self._inflight = {}
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(keepalive_timeout=30)
+            )
+        return self._session
+
+    async def get_rate(self, currency):
+        cached = self._rates.get(currency)
+        if cached is not None:
+            rate, fetched_at = cached
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                return rate
+            if age < self.ttl + self.stale_ttl:
+                self._fetch(currency)
+                return rate
+
+        # Отмена обработчика не должна отменять запрос, который ждут другие
+        return await asyncio.shield(self._fetch(currency))
+
+    # Запрос курса к сервису; пока он идёт, новые вызовы получают ту же задачу
+    def _fetch(self, currency):
+        task = self._inflight.get(currency)
+        if task is None:
+            task = asyncio.ensure_future(self._request(currency))
+            self._inflight[currency] = task
+            task.add_done_callback(lambda task: self._done(currency, task))
+        return task
+
+    def _done(self, currency, task):
+        self._inflight.pop(currency, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Не удалось обновить курс %s: %s", currency, task.exception())
+
+    async def _request(self, currency):
+        try:
+            with timed('http', 'GET'):
+                async with self._get_session().get(
+                    f"{self.base_url}/rate", params={'currency': currency}
+                ) as response:
+                    data = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise RateError(f"сервис курсов недоступен: {e!r}") from e
+
+        if response.status != 200:
+            raise RateError(data.get('message', f'HTTP {response.status}'))
+        rate = float(data['rate'])
+        self._rates[currency] = (rate, time.monotonic())
+        return rate
+
+    async def close(self):
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
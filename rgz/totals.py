@@ -0,0 +1,129 @@
+import argparse
+import os
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Итоги операций по месяцам: сумма и число операций каждого типа за месяц.
+# Строка меняется в той же транзакции, что и сама операция, поэтому сводка
+# читает по строке на месяц, а не все операции пользователя
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS operation_totals (
+        chat_id BIGINT NOT NULL,
+        month DATE NOT NULL,
+        type_operation VARCHAR NOT NULL,
+        total NUMERIC NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, month, type_operation)
+    )
+"""
+
+# Итоги, посчитанные заново по таблице operations
+AGGREGATE = """
+    SELECT chat_id, date_trunc('month', date)::date AS month, type_operation,
+           sum(sum)::numeric AS total, count(*) AS count
+    FROM operations
+    GROUP BY 1, 2, 3
+"""
+
+
+# Создаёт таблицу итогов; если её ещё не было, заполняет по уже
+# существующим операциям
+def create_totals_table(cur):
+    cur.execute("SELECT to_regclass('operation_totals')")
+    if cur.fetchone()[0] is not None:
+        return
+    cur.execute(CREATE_TABLE)
+    rebuild(cur)
+
+
+# Учитывает новую операцию; вызывается в транзакции INSERT INTO operations
+def add_operation(cur, chat_id, date, amount, type_operation):
+    cur.execute(
+        "INSERT INTO operation_totals (chat_id, month, type_operation, total, count) "
+        "VALUES (%s, %s, %s, %s, 1) "
+        "ON CONFLICT (chat_id, month, type_operation) DO UPDATE "
+        "SET total = operation_totals.total + EXCLUDED.total, "
+        "count = operation_totals.count + 1",
+        (chat_id, date.replace(day=1), type_operation, amount)
+    )
+
+
+# Итоги пользователя по месяцам от start до end включительно (первые числа
+# месяцев, None - без ограничения): [(месяц, {тип: сумма})] от новых к старым
+def fetch_summary(cur, chat_id, start=None, end=None):
+    cur.execute(
+        "SELECT month, type_operation, total FROM operation_totals "
+        "WHERE chat_id = %s AND (%s::date IS NULL OR month >= %s) "
+        "AND (%s::date IS NULL OR month <= %s) "
+        "ORDER BY month DESC",
+        (chat_id, start, start, end, end)
+    )
+    months = []
+    for month, type_operation, total in cur.fetchall():
+        if not months or months[-1][0] != month:
+            months.append((month, {}))
+        months[-1][1][type_operation] = total
+    return months
+
+
+# Строки итогов, которые расходятся с пересчётом по operations:
+# [(chat_id, месяц, тип, сумма по operations, сумма в итогах)]
+def check(cur):
+    cur.execute(
+        "SELECT chat_id, month, type_operation, a.total, t.total "
+        f"FROM ({AGGREGATE}) a FULL JOIN operation_totals t "
+        "USING (chat_id, month, type_operation) "
+        "WHERE round(a.total, 2) IS DISTINCT FROM round(t.total, 2) "
+        "OR a.count IS DISTINCT FROM t.count "
+        "ORDER BY chat_id, month"
+    )
+    return cur.fetchall()
+
+
+# Пересчитывает итоги по operations. Блокировка не даёт добавлять операции,
+# пока транзакция пересчёта не завершится
+def rebuild(cur):
+    cur.execute("LOCK TABLE operations IN SHARE MODE")
+    cur.execute("DELETE FROM operation_totals")
+    cur.execute(
+        "INSERT INTO operation_totals (chat_id, month, type_operation, total, count) "
+        + AGGREGATE
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка и пересчёт итогов операций rgz")
+    parser.add_argument(
+        "command", choices=["check", "rebuild"],
+        help="check - найти расхождения с operations, rebuild - пересчитать итоги"
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(
+        host=os.environ['DB_HOST'],
+        port=os.environ['DB_PORT'],
+        user=os.environ['DB_USER'],
+        password=os.environ['DB_PASSWORD'],
+        database=os.environ['DB_NAME']
+    )
+    try:
+        with conn.cursor() as cur:
+            if args.command == "check":
+                mismatches = check(cur)
+                for chat_id, month, type_operation, expected, actual in mismatches:
+                    print(f"{chat_id} {month:%Y-%m} {type_operation}: "
+                          f"по операциям {expected}, в итогах {actual}")
+                print(f"Расхождений: {len(mismatches)}")
+            else:
+                cur.execute(CREATE_TABLE)
+                rebuild(cur)
+                conn.commit()
+                print("Итоги пересчитаны")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
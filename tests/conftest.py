@@ -0,0 +1,18 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Тесты импортируют модули так же, как боты при запуске из корня
+# репозитория: common.outbox, lab6.http_client
+sys.path.insert(0, ROOT)
+
+# Настройки подключения к БД читаются при импорте; сама БД тестам не нужна
+for name, value in {
+    'DB_HOST': 'localhost',
+    'DB_PORT': '5432',
+    'DB_USER': 'test',
+    'DB_PASSWORD': 'test',
+    'DB_NAME': 'test',
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,122 @@
+import asyncio
+
+from common.alerts import Alert, Alerts
+
+
+# Хранилище в памяти; deleted_elsewhere - подписки, которые "уже удалил"
+# другой процесс бота
+class MemoryStore:
+    def __init__(self):
+        self.rows = {}
+        self.deleted_elsewhere = set()
+
+    async def all(self):
+        return list(self.rows.values())
+
+    async def add(self, chat_id, currency_name, op, threshold):
+        alert = Alert(len(self.rows) + 1, chat_id, currency_name, op, threshold)
+        self.rows[alert.id] = alert
+        return alert
+
+    async def delete(self, alert_ids, chat_id=None):
+        deleted = []
+        for alert_id in alert_ids:
+            alert = self.rows.get(alert_id)
+            if alert is None or (chat_id is not None and alert.chat_id != chat_id):
+                continue
+            del self.rows[alert_id]
+            if alert_id not in self.deleted_elsewhere:
+                deleted.append(alert_id)
+        return deleted
+
+
+async def lookup(currency_name):
+    rates = {'USD': 90.0, 'EUR': 100.0}
+    currency_name = currency_name.upper()
+    return (currency_name, rates[currency_name]) if currency_name in rates else None
+
+
+def make_alerts():
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append((chat_id, text))
+
+    store = MemoryStore()
+    return Alerts(store, send), store, sent
+
+
+def test_alert_fires_once_when_rate_crosses_threshold():
+    async def main():
+        alerts, store, sent = make_alerts()
+        reply = await alerts.command(1, 'usd > 95', lookup)
+        assert reply.startswith('Сообщу, когда курс USD станет > 95')
+
+        alerts.on_rate_change('USD', 90.0, 94.0)
+        alerts.on_rate_change('USD', 94.0, 96.0)
+        alerts.on_rate_change('USD', 94.0, 97.0)
+        await asyncio.sleep(0)
+        await asyncio.gather(*alerts._tasks)
+
+        assert sent == [(1, 'Курс USD: 96.0 RUB (USD > 95)')]
+        assert not store.rows
+        assert await alerts.command(1, None, lookup) == 'Подписок нет. Пример: /alert USD > 95'
+
+    asyncio.run(main())
+
+
+def test_alert_already_met_is_not_created():
+    async def main():
+        alerts, store, _ = make_alerts()
+        reply = await alerts.command(1, 'USD < 95', lookup)
+        assert 'уже < 95' in reply
+        assert not store.rows
+
+    asyncio.run(main())
+
+
+def test_alert_deleted_by_another_process_is_not_sent():
+    async def main():
+        alerts, store, sent = make_alerts()
+        await alerts.command(1, 'EUR < 99', lookup)
+        store.deleted_elsewhere.add(1)
+
+        alerts.on_rate_change('EUR', 100.0, 98.0)
+        await asyncio.gather(*alerts._tasks)
+        assert sent == []
+
+    asyncio.run(main())
+
+
+def test_unalert_only_removes_own_alerts():
+    async def main():
+        alerts, store, _ = make_alerts()
+        await alerts.command(1, 'USD > 95', lookup)
+
+        assert await alerts.unalert_command(2, '1') == 'Подписка не найдена'
+        assert await alerts.unalert_command(1, 'x') == 'Укажите номер подписки из списка /alert'
+        assert await alerts.unalert_command(1, '1') == 'Подписка удалена'
+        assert not store.rows and len(alerts.index) == 0
+
+    asyncio.run(main())
+
+
+def test_alert_from_another_process_fires_here():
+    async def main():
+        alerts, store, sent = make_alerts()
+        alert = await store.add(2, 'USD', '>', 95.0)
+        alerts.remember(alert)
+        alerts.remember(alert)
+        assert len(alerts.index) == 1
+
+        alerts.on_rate_change('USD', 90.0, 96.0)
+        await asyncio.gather(*alerts._tasks)
+        assert sent == [(2, 'Курс USD: 96.0 RUB (USD > 95)')]
+
+        alert = await store.add(2, 'EUR', '<', 99.0)
+        alerts.remember(alert)
+        alerts.forget(alert.id)
+        alerts.forget(alert.id)
+        assert len(alerts.index) == 0
+
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+import asyncio
+import types
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+from common import fsm_storage
+from common.fsm_storage import SqliteStorage
+
+
+class Dialog(StatesGroup):
+    waiting_for_amount = State()
+
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+# Два процесса бота глазами хранилища: два экземпляра на одном файле
+def open_pair(tmp_path, ttl=3600):
+    path = str(tmp_path / 'fsm.db')
+    return SqliteStorage(path, ttl), SqliteStorage(path, ttl)
+
+
+def test_dialog_continues_in_another_worker(tmp_path):
+    async def main():
+        first, second = open_pair(tmp_path)
+        try:
+            await first.set_state(KEY, Dialog.waiting_for_amount)
+            await first.set_data(KEY, {'currency': 'USD'})
+
+            assert await second.get_state(KEY) == Dialog.waiting_for_amount.state
+            assert await second.get_data(KEY) == {'currency': 'USD'}
+
+            # Второй процесс продолжает диалог, первый видит изменения
+            await second.set_data(KEY, {'currency': 'USD', 'amount': 100})
+            await second.set_state(KEY, None)
+            assert await first.get_state(KEY) is None
+            assert await first.get_data(KEY) == {'currency': 'USD', 'amount': 100}
+        finally:
+            await first.close()
+            await second.close()
+
+    asyncio.run(main())
+
+
+def test_expired_dialog_is_forgotten(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fsm_storage, 'time', types.SimpleNamespace(time=lambda: now[0]))
+
+    async def main():
+        first, second = open_pair(tmp_path, ttl=60)
+        try:
+            await first.set_state(KEY, Dialog.waiting_for_amount)
+            await first.set_data(KEY, {'currency': 'USD'})
+
+            now[0] += 59
+            assert await second.get_state(KEY) == Dialog.waiting_for_amount.state
+
+            now[0] += 61
+            assert await second.get_state(KEY) is None
+            assert await second.get_data(KEY) == {}
+
+            # Новый диалог после истечения не подхватывает старые данные
+            await second.set_state(KEY, Dialog.waiting_for_amount)
+            assert await first.get_data(KEY) == {}
+        finally:
+            await first.close()
+            await second.close()
+
+    asyncio.run(main())
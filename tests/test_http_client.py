@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from lab6.http_client import HttpClient, ServiceError
+
+
+# Локальный сервер: /slow отвечает через delay секунд, каждый ответ
+# сообщает номер TCP-соединения, по которому пришёл запрос
+async def start_server(delay):
+    connections = {}
+
+    async def slow(request):
+        await asyncio.sleep(delay)
+        peer = request.transport.get_extra_info('peername')
+        connection = connections.setdefault(peer, len(connections))
+        return web.json_response({'connection': connection})
+
+    app = web.Application()
+    app.router.add_get('/slow', slow)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/slow', connections
+
+
+def test_concurrent_requests_share_one_session():
+    async def main():
+        runner, url, connections = await start_server(0.2)
+        client = HttpClient(limit=10)
+        try:
+            started = time.perf_counter()
+            first = await asyncio.gather(*(client.get(url) for _ in range(50)))
+            session = client._session
+            second = await asyncio.gather(*(client.get(url) for _ in range(50)))
+            elapsed = time.perf_counter() - started
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+        assert all(response.status == 200 for response in first + second)
+        # Одна сессия на все запросы, соединения переиспользуются
+        assert client._session is session
+        assert len(connections) <= 10
+        # 100 запросов по 0.2 с через 10 соединений, а не по одному
+        assert elapsed < 10 * 0.2 * 2
+
+    asyncio.run(main())
+
+
+def test_session_timeout_applies_without_per_call_timeout():
+    async def main():
+        runner, url, _ = await start_server(3)
+        client = HttpClient(timeout=0.5, retries=0)
+        try:
+            started = time.perf_counter()
+            with pytest.raises(ServiceError):
+                await client.get(url)
+            return time.perf_counter() - started
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    assert asyncio.run(main()) < 2
+
+
+def test_per_call_timeout_overrides_session_timeout():
+    async def main():
+        runner, url, _ = await start_server(1)
+        client = HttpClient(timeout=0.2, retries=0)
+        try:
+            response = await client.get(url, timeout=3)
+        finally:
+            await client.close()
+            await runner.cleanup()
+        assert response.status == 200
+
+    asyncio.run(main())
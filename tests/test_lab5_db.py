@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from lab5 import db as lab5_db
+
+# Сколько блокирует один запрос к "БД"
+QUERY_SECONDS = 0.01
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query, params=None):
+        if self.conn.in_use_by != threading.get_ident():
+            raise AssertionError("соединение используется из двух потоков")
+        time.sleep(QUERY_SECONDS)
+        if query == 'FAIL':
+            raise RuntimeError(query)
+        self.result = [(params,)]
+        self.rowcount = 1
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.in_use_by = None
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+# Пул с проверками: больше maxconn соединений одновременно не выдаёт,
+# соединение нельзя вернуть дважды
+class FakePool:
+    instances = []
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.maxconn = maxconn
+        self.lock = threading.Lock()
+        self.idle = [FakeConnection() for _ in range(maxconn)]
+        self.out = set()
+        self.max_out = 0
+        FakePool.instances.append(self)
+
+    def getconn(self):
+        with self.lock:
+            if not self.idle:
+                raise AssertionError("пул исчерпан")
+            conn = self.idle.pop()
+            self.out.add(conn)
+            self.max_out = max(self.max_out, len(self.out))
+        conn.in_use_by = threading.get_ident()
+        return conn
+
+    def putconn(self, conn, close=False):
+        conn.in_use_by = None
+        with self.lock:
+            self.out.remove(conn)
+            self.idle.append(conn)
+
+    def closeall(self):
+        pass
+
+
+@pytest.fixture
+def database(monkeypatch):
+    monkeypatch.setattr(lab5_db, 'ThreadedConnectionPool', FakePool)
+    database = lab5_db.Database(minconn=1, maxconn=10)
+    database.open()
+    yield database
+    database.close()
+
+
+def test_hundreds_of_chats_share_the_pool_without_blocking_the_loop(database):
+    chats = 300
+
+    async def chat(chat_id):
+        if chat_id % 10 == 0:
+            with pytest.raises(RuntimeError):
+                await database.execute('FAIL', (chat_id,))
+            return None
+        return await database.fetchall('SELECT', (chat_id,))
+
+    async def main():
+        # Цикл событий отмечается каждые 5 мс; если бы запросы шли в нём,
+        # между отметками прошло бы время всех запросов подряд
+        gaps = []
+        stop = asyncio.Event()
+
+        async def ticker():
+            last = time.perf_counter()
+            while not stop.is_set():
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticking = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        results = await asyncio.gather(*(chat(chat_id) for chat_id in range(chats)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await ticking
+        return results, elapsed, max(gaps)
+
+    results, elapsed, max_gap = asyncio.run(main())
+
+    for chat_id, result in enumerate(results):
+        if chat_id % 10:
+            assert result == [((chat_id,),)]
+
+    pool = FakePool.instances[-1]
+    # Все соединения вернулись, одновременно выдавалось не больше maxconn
+    assert not pool.out
+    assert len(pool.idle) == 10
+    assert pool.max_out == 10
+    # Ошибочные транзакции откатились, остальные зафиксированы
+    assert sum(conn.rollbacks for conn in pool.idle) == chats // 10
+    assert sum(conn.commits for conn in pool.idle) == chats - chats // 10
+    # Запросы шли параллельно в 10 потоках, а цикл событий не простаивал
+    assert elapsed < chats * QUERY_SECONDS / 2
+    assert max_gap < chats * QUERY_SECONDS / 10
@@ -0,0 +1,9 @@
+from common import outbox, runner
+
+
+def test_global_rate_is_split_between_workers(monkeypatch):
+    monkeypatch.setattr(runner, 'BOT_WORKERS', 4)
+    assert outbox.Outbox(bot=None, rate=20).bucket.rate == 5
+
+    monkeypatch.setattr(runner, 'BOT_WORKERS', 1)
+    assert outbox.Outbox(bot=None, rate=20).bucket.rate == 20
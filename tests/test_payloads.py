@@ -0,0 +1,38 @@
+from lab6.payloads import parse_currencies
+
+
+def test_single_currency_rate_must_be_number():
+    assert parse_currencies({'currency_name': 'USD', 'rate': '90,5'}, 'rate') == (
+        None, False, 'rate должен быть числом'
+    )
+    assert parse_currencies({'currency_name': 'USD', 'rate': '90.5'}, 'rate') == (
+        [('USD', 90.5)], False, None
+    )
+
+
+def test_batch_lists_every_invalid_item():
+    pairs, is_batch, error = parse_currencies({'currencies': [
+        {'currency_name': 'USD', 'new_rate': 90},
+        {'currency_name': 'EUR', 'new_rate': 'abc'},
+        {'currency_name': 'CNY', 'new_rate': True},
+        {'new_rate': 11},
+        {'currency_name': 'GBP', 'new_rate': 'NaN'},
+    ]}, 'new_rate')
+
+    assert pairs is None and is_batch
+    assert error == (
+        'Неверные элементы: 1 (EUR): new_rate должен быть числом; '
+        '2 (CNY): new_rate должен быть числом; '
+        '3: Необходимо указать currency_name и new_rate; '
+        '4 (GBP): new_rate должен быть числом'
+    )
+
+
+def test_batch_keeps_last_rate_of_repeated_name():
+    pairs, is_batch, error = parse_currencies({'currencies': [
+        {'currency_name': 'USD', 'rate': 90},
+        {'currency_name': 'EUR', 'rate': 100},
+        {'currency_name': 'USD', 'rate': '91'},
+    ]}, 'rate')
+
+    assert (pairs, is_batch, error) == ([('EUR', 100.0), ('USD', 91.0)], True, None)
@@ -0,0 +1,72 @@
+import asyncio
+
+from aiogram import Dispatcher, types
+from aiogram.filters.command import Command
+from aiohttp import ClientSession, web
+
+from common import webhook
+from common.fake_telegram import FakeTelegram
+
+SECRET = 'test-secret'
+
+
+async def start_app(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}'
+
+
+async def wait_for_messages(fake, count):
+    for _ in range(100):
+        if len(fake.sent) >= count:
+            return
+        await asyncio.sleep(0.02)
+
+
+# Обновление от fake_telegram проходит через вебхук бота, ответ бота
+# записывается в fake_telegram; запрос с чужим секретом отклоняется
+def test_webhook_delivers_update_and_checks_secret(monkeypatch):
+    async def main():
+        fake = FakeTelegram()
+        fake_runner, fake_url = await start_app(fake.make_app())
+        monkeypatch.setattr(webhook, 'TELEGRAM_API_URL', fake_url)
+        monkeypatch.setattr(webhook, 'WEBHOOK_SECRET', SECRET)
+
+        dp = Dispatcher()
+
+        @dp.message(Command('start'))
+        async def cmd_start(message: types.Message):
+            await message.answer('Привет')
+
+        bot = webhook.create_bot('1:test')
+        bot_runner, bot_url = await start_app(webhook.create_webhook_app(dp, bot))
+        try:
+            await bot.set_webhook(bot_url + webhook.WEBHOOK_PATH, secret_token=SECRET)
+            assert fake.webhook_secret == SECRET
+
+            async with ClientSession() as session:
+                async with session.post(
+                    fake_url + '/_send', json={'chat_id': 5, 'text': '/start'}
+                ) as response:
+                    assert (await response.json())['webhook_status'] == 200
+                await wait_for_messages(fake, 1)
+                assert [(m['method'], m['chat_id'], m['text']) for m in fake.sent] == [
+                    ('sendmessage', '5', 'Привет')
+                ]
+
+                fake.webhook_secret = 'wrong'
+                async with session.post(
+                    fake_url + '/_send', json={'chat_id': 5, 'text': '/start'}
+                ) as response:
+                    assert (await response.json())['webhook_status'] == 401
+                await asyncio.sleep(0.2)
+                assert len(fake.sent) == 1
+        finally:
+            await bot_runner.cleanup()
+            await bot.session.close()
+            await fake_runner.cleanup()
+
+    asyncio.run(main())